@@ -1,22 +1,31 @@
-import uuid
 from datetime import datetime
-from typing import List
-
-import cloudinary
-import cloudinary.uploader
-from cloudinary.utils import cloudinary_url
-from fastapi import APIRouter, Depends, File, HTTPException, Query, UploadFile, status
+from typing import List, Optional
+
+from fastapi import (
+    APIRouter,
+    Depends,
+    File,
+    HTTPException,
+    Query,
+    Security,
+    UploadFile,
+    status,
+)
+from fastapi.security import HTTPAuthorizationCredentials
 from motor.motor_asyncio import AsyncIOMotorDatabase
-from pymongo import ReturnDocument
 
 from app.core.auth import AuthHandler
 from app.core._id import PyObjectId
 from app.core.database import get_database
+from app.core.export import ExportFormat, export_response
 from app.core.helpers import transform_mongo_data
-from app.core.pagination import paginate
+from app.core.pagination import CURSOR_HELP, paginate, paginate_cursor
+from app.core.passwords import password_hasher
+from app.uploads.services import upload_pipeline
 from app.accounts.permissions import hasAdminPermission
 from app.accounts.schemas import (
     MFARequest,
+    QRCodeFormat,
     UserLoginResponseSchema,
     UserLoginSchema,
     UserRegisterSchema,
@@ -26,9 +35,12 @@ from app.accounts.schemas import (
     UserInfoPaginatedResponseSchema,
 )
 from app.accounts.services import (
+    USER_EXPORT_FIELDS,
+    USER_EXPORT_PROJECTION,
     disable_user_mfa,
-    get_current_user,
     generate_mfa_qrcode,
+    invalidate_user,
+    save_user_image,
     verify_2fa_otp,
 )
 
@@ -51,16 +63,24 @@ async def login(
     existing_user = await db["users"].find_one({"email": user.email})
     last_login_data = {"last_login": datetime.now()}
     await db["users"].update_one({"email": user.email}, {"$set": last_login_data})
+    invalidate_user(existing_user)
 
     if not existing_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST, detail="User not found"
         )
 
-    if not auth_handler.verify_password(user.password, existing_user["password"]):
+    verified, new_hash = await password_hasher.verify(
+        user.password, existing_user["password"]
+    )
+    if not verified:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid credentials"
         )
+    if new_hash:
+        await db["users"].update_one(
+            {"_id": existing_user["_id"]}, {"$set": {"password": new_hash}}
+        )
 
     return {
         "id": str(existing_user["_id"]),
@@ -70,6 +90,11 @@ async def login(
     }
 
 
+@router.post("/logout", status_code=status.HTTP_204_NO_CONTENT)
+async def logout(auth: HTTPAuthorizationCredentials = Security(auth_handler.security)):
+    auth_handler.revoke_token(auth.credentials)
+
+
 @router.post(
     "/register",
     response_model=UserLoginResponseSchema,
@@ -85,7 +110,7 @@ async def create_user(
         )
 
     user_dict = user.model_dump()
-    user_dict["password"] = auth_handler.get_password_hash(user.password)
+    user_dict["password"] = await password_hasher.hash(user.password)
     user_dict["created_at"] = user_dict["updated_at"] = datetime.now()
     res = await db["users"].insert_one(user_dict)
     new_user = await db["users"].find_one({"_id": res.inserted_id})
@@ -98,14 +123,30 @@ async def create_user(
     }
 
 
+@router.get("/export")
+async def export_users(
+    format: ExportFormat = ExportFormat.NDJSON,
+    db: AsyncIOMotorDatabase = Depends(get_database),
+    req_user=Depends(auth_handler.user_wrapper),
+):
+    if not hasAdminPermission(req_user):
+        msg = "Only admins are allowed to perform this action."
+        raise HTTPException(status_code=400, detail=msg)
+
+    cursor = db["users"].find({}, USER_EXPORT_PROJECTION).sort("_id")
+    return export_response(cursor, format, "users", USER_EXPORT_FIELDS)
+
+
 @router.get("/{id}", response_model=UserInfoResponseSchema)
 async def get_user(
     id: str,
     db: AsyncIOMotorDatabase = Depends(get_database),
-    current_user=Depends(auth_handler.auth_wrapper),
+    req_user=Depends(auth_handler.user_wrapper),
 ):
-    user = await db["users"].find_one({"_id": PyObjectId(id)})
-    req_user = await get_current_user(current_user, db)
+    if str(req_user["_id"]) == id:
+        user = req_user
+    else:
+        user = await db["users"].find_one({"_id": PyObjectId(id)})
 
     if not user:
         raise HTTPException(
@@ -129,14 +170,21 @@ async def get_user(
 async def admin_get_users(
     page: int = Query(1, ge=1),
     page_size: int = Query(10, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description=CURSOR_HELP),
     db: AsyncIOMotorDatabase = Depends(get_database),
-    current_user=Depends(auth_handler.auth_wrapper),
+    req_user=Depends(auth_handler.user_wrapper),
 ):
-    req_user = await get_current_user(current_user, db)
     if not hasAdminPermission(req_user):
         msg = "Only admins are allowed to perform this action."
         raise HTTPException(status_code=400, detail=msg)
 
+    if cursor is not None:
+        paginated_response = await paginate_cursor(
+            db["users"], {}, cursor=cursor, page_size=page_size
+        )
+        paginated_response["items"] = transform_mongo_data(paginated_response["items"])
+        return paginated_response
+
     users = await db["users"].find().to_list(length=None)
     paginated_response = paginate(
         transform_mongo_data(users), page=page, page_size=page_size
@@ -149,9 +197,8 @@ async def update_user_role(
     id: str,
     payload: UserUpdateRoleSchema,
     db: AsyncIOMotorDatabase = Depends(get_database),
-    current_user=Depends(auth_handler.auth_wrapper),
+    req_user=Depends(auth_handler.user_wrapper),
 ):
-    req_user = await get_current_user(current_user, db)
     user = await db["users"].find_one({"_id": PyObjectId(id)})
 
     if not user:
@@ -167,6 +214,8 @@ async def update_user_role(
     payload["last_updated_by"] = req_user.get("id")
 
     await db["users"].update_one({"_id": PyObjectId(id)}, {"$set": payload})
+    invalidate_user(user)
+    auth_handler.revoke_subject(user["email"])
     updated_user = await db["users"].find_one({"_id": PyObjectId(id)})
     updated_user = transform_mongo_data(updated_user)
     return updated_user
@@ -185,6 +234,7 @@ async def update_user(
     payload = payload.dict(exclude_unset=True)
     payload["updated_at"] = datetime.now()
     await db["users"].update_one({"_id": PyObjectId(id)}, {"$set": payload})
+    invalidate_user(user)
     updated_user = await db["users"].find_one({"_id": PyObjectId(id)})
     transform_mongo_data(update_user)
     return updated_user
@@ -194,29 +244,29 @@ async def update_user(
 async def delete_user(
     id: str,
     db: AsyncIOMotorDatabase = Depends(get_database),
-    current_user=Depends(auth_handler.auth_wrapper),
+    req_user=Depends(auth_handler.user_wrapper),
 ):
-    req_user = await get_current_user(current_user, db)
     user = await db["users"].find_one({"_id": PyObjectId(id)})
 
     if not user:
         raise HTTPException(status_code=ERROR_CODE, detail="User not found")
 
-    if not req_user.role == "admin":
+    if not req_user.get("role") == "admin":
         raise HTTPException(status_code=ERROR_CODE, detail="Not allowed, contact admin")
 
     await db["users"].delete_one({"_id": PyObjectId(id)})
+    invalidate_user(user)
+    auth_handler.revoke_subject(user["email"])
 
 
-@router.post("/{id}/images/")
+@router.post("/{id}/images/", status_code=status.HTTP_202_ACCEPTED)
 async def upload_user_image(
     id: str,
     file: UploadFile = File(...),
-    current_user=Depends(auth_handler.auth_wrapper),
+    req_user=Depends(auth_handler.user_wrapper),
     db: AsyncIOMotorDatabase = Depends(get_database),
 ):
     user = await db["users"].find_one({"_id": PyObjectId(id)})
-    req_user = await get_current_user(current_user, db)
 
     if not req_user["_id"] == user["_id"]:
         raise HTTPException(status_code=400, detail="Not allowed, contact admin")
@@ -226,21 +276,15 @@ async def upload_user_image(
             status_code=400, detail="Invalid file type. Only JPEG and PNG are allowed."
         )
 
-    file_name = f"{uuid.uuid4()}"
-    res = cloudinary.uploader.upload(file.file, public_id=file_name)
-    image_url = res.get("url")
-
-    await db["users"].find_one_and_update(
-        {"_id": PyObjectId(id)},
-        {"$set": {"image_url": image_url}},
-        return_document=ReturnDocument.AFTER,
+    job = await upload_pipeline.submit(
+        db, file, "user_image", id, req_user["_id"], save_user_image
     )
-    return {"detail": "Uploaded image successfully"}
+    return {"job_id": str(job["_id"]), "status": job["status"]}
 
 
 @router.get("")
 async def get_dashboard_data(
-    current_user=Depends(auth_handler.auth_wrapper),
+    req_user=Depends(auth_handler.user_wrapper),
     db: AsyncIOMotorDatabase = Depends(get_database),
 ):
     data = {}
@@ -249,42 +293,30 @@ async def get_dashboard_data(
 
 @router.post("/generate_mfa_secret")
 async def generate_mfa_secret(
-    current_user=Depends(auth_handler.auth_wrapper),
+    format: QRCodeFormat = QRCodeFormat.PNG,
+    req_user=Depends(auth_handler.user_wrapper),
     db: AsyncIOMotorDatabase = Depends(get_database),
 ):
-    user = await db["users"].find_one({"email": current_user})
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-
-    qr_code, setup_key = await generate_mfa_qrcode(user, db)
+    qr_code, setup_key = await generate_mfa_qrcode(req_user, db, format)
     return {"qr_code": qr_code, "setup_key": setup_key}
 
 
 @router.post("/disable_mfa")
 async def disable_mfa(
-    current_user=Depends(auth_handler.auth_wrapper),
+    req_user=Depends(auth_handler.user_wrapper),
     db: AsyncIOMotorDatabase = Depends(get_database),
 ):
-    user = await db["users"].find_one({"email": current_user})
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-
-    await disable_user_mfa
+    await disable_user_mfa(req_user, db)
     return {"detail": "MFA has been disabled for this user."}
 
 
 @router.post("/configure_mfa")
 async def configure_mfa(
     data: MFARequest,
-    current_user=Depends(auth_handler.auth_wrapper),
+    req_user=Depends(auth_handler.user_wrapper),
     db: AsyncIOMotorDatabase = Depends(get_database),
 ):
-    user = await db["users"].find_one({"email": current_user})
-    print("••• ", user)
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-
-    verified = await verify_2fa_otp(user, data.otp_code, db)
+    verified = await verify_2fa_otp(req_user, data.otp_code, db)
     if not verified:
         raise HTTPException(status_code=404, detail="User not found")
 
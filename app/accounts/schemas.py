@@ -15,6 +15,11 @@ class UserRole(str, Enum):
     DISPATCH = "dispatch"
 
 
+class QRCodeFormat(str, Enum):
+    PNG = "png"
+    SVG = "svg"
+
+
 class UserLoginSchema(BaseModel):
     email: EmailStr
     password: str = Field(..., min_length=8)
@@ -2,15 +2,75 @@ import base64
 import io
 import pyotp
 import qrcode
+import qrcode.image.svg
 from fastapi import Depends, HTTPException
 from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import IndexModel
+from starlette.concurrency import run_in_threadpool
 
+from app.accounts.schemas import QRCodeFormat
+
+from app.core import settings
 from app.core._id import PyObjectId
+from app.core.cache import TTLCache
 from app.core.database import get_database
+from app.core.indexes import register_indexes, register_query
+
+register_indexes("users", [IndexModel("email", name="email", unique=True)])
+register_query("current_user", "users", {"email": "user@foodnest.com"})
+
+# Keyed by token subject (the email). Writes in this process invalidate
+# their entry, other workers see a change within USER_CACHE_TTL seconds.
+user_cache = TTLCache(
+    "users",
+    maxsize=settings.USER_CACHE_SIZE,
+    ttl=settings.USER_CACHE_TTL,
+    enabled=settings.USER_CACHE_ENABLED,
+)
+
+USER_EXPORT_PROJECTION = {"password": 0, "mfa_secret": 0}
+USER_EXPORT_FIELDS = [
+    "id",
+    "email",
+    "first_name",
+    "middle_name",
+    "last_name",
+    "phone",
+    "address",
+    "role",
+    "is_active",
+    "created_at",
+]
 
 
 async def get_current_user(email, db):
-    return await db["users"].find_one({"email": email})
+    user = user_cache.get(email)
+    if user is None:
+        user = await db["users"].find_one({"email": email})
+        if user is None:
+            return None
+        user_cache.set(email, user)
+    return dict(user)
+
+
+# Rendered QR data URIs keyed by user, secret and format; a new secret is a
+# new key, so stale codes are never served and simply age out.
+mfa_qr_cache = TTLCache(
+    "mfa_qrcodes", maxsize=settings.MFA_QR_CACHE_SIZE, ttl=settings.MFA_QR_CACHE_TTL
+)
+
+
+def invalidate_user(user):
+    if user:
+        user_cache.invalidate(user["email"])
+
+
+async def save_user_image(db, job, uploaded):
+    await db["users"].update_one(
+        {"_id": PyObjectId(job["target_id"])},
+        {"$set": {"image_url": uploaded["url"]}},
+    )
+    return {"url": uploaded["url"]}
 
 
 async def verify_2fa_otp(user, otp, db):
@@ -19,11 +79,29 @@ async def verify_2fa_otp(user, otp, db):
         await db["users"].update_one(
             {"_id": PyObjectId(user["_id"])}, {"$set": {"mfa_enabled": True}}
         )
+        invalidate_user(user)
         return True
     return False
 
 
-async def generate_mfa_qrcode(user, db):
+def render_qrcode(data: str, format: QRCodeFormat = QRCodeFormat.PNG) -> str:
+    """
+    Render `data` as a QR code data URI. SVG output is a single vector path
+    built without PIL, for deployments without it or clients that scale it.
+    """
+    buffer = io.BytesIO()
+    if format == QRCodeFormat.SVG:
+        qrcode.make(data, image_factory=qrcode.image.svg.SvgPathImage).save(buffer)
+        media_type = "image/svg+xml"
+    else:
+        qrcode.make(data).save(buffer, format="PNG")
+        media_type = "image/png"
+
+    encoded = base64.b64encode(buffer.getvalue()).decode("utf-8")
+    return f"data:{media_type};base64,{encoded}"
+
+
+async def generate_mfa_qrcode(user, db, format: QRCodeFormat = QRCodeFormat.PNG):
     if (
         "mfa_secret" not in user
         or "mfa_enabled" not in user
@@ -35,20 +113,17 @@ async def generate_mfa_qrcode(user, db):
             {"_id": PyObjectId(user["_id"])},
             {"$set": {"mfa_secret": new_mfa_secret, "mfa_enabled": True}},
         )
+        invalidate_user(user)
         user["mfa_secret"] = new_mfa_secret
 
-    otp_uri = pyotp.TOTP(user["mfa_secret"]).provisioning_uri(
-        name=user["email"], issuer_name="Foodnest Application"
-    )
-
-    qr = qrcode.make(otp_uri)
-    buffer = io.BytesIO()
-    qr.save(buffer, format="PNG")
-
-    buffer.seek(0)
-    qr_code_data_uri = (
-        f"data:image/png;base64,{base64.b64encode(buffer.getvalue()).decode('utf-8')}"
-    )
+    key = (str(user["_id"]), user["email"], user["mfa_secret"], format)
+    qr_code_data_uri = mfa_qr_cache.get(key)
+    if qr_code_data_uri is None:
+        otp_uri = pyotp.TOTP(user["mfa_secret"]).provisioning_uri(
+            name=user["email"], issuer_name="Foodnest Application"
+        )
+        qr_code_data_uri = await run_in_threadpool(render_qrcode, otp_uri, format)
+        mfa_qr_cache.set(key, qr_code_data_uri)
 
     return qr_code_data_uri, user["mfa_secret"]
 
@@ -67,5 +142,6 @@ async def disable_user_mfa(user, db):
         {"_id": PyObjectId(user["_id"])},
         {"$set": {"mfa_secret": "", "mfa_enabled": False}},
     )
+    invalidate_user(user)
 
     return True
@@ -0,0 +1,51 @@
+from fastapi import APIRouter, Depends, HTTPException
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from app.accounts.permissions import hasAdminPermission
+from app.core.auth import AuthHandler
+from app.core.cache import CACHES
+from app.core.database import get_database
+from app.core.indexes import explain_queries
+from app.core.ratelimit import rate_limiter
+from app.products.prices import price_table
+
+auth_handler = AuthHandler()
+router = APIRouter(prefix="/admin", tags=["Admin"])
+
+
+@router.get("/diagnostics/indexes")
+async def get_index_report(
+    req_user=Depends(auth_handler.user_wrapper),
+    db: AsyncIOMotorDatabase = Depends(get_database),
+):
+    if not hasAdminPermission(req_user):
+        msg = "Only admins are allowed to perform this action."
+        raise HTTPException(status_code=403, detail=msg)
+
+    queries = await explain_queries(db)
+    return {
+        "queries": queries,
+        "collscans": [query["name"] for query in queries if query["collscan"]],
+    }
+
+
+@router.get("/diagnostics/caches")
+async def get_cache_stats(
+    req_user=Depends(auth_handler.user_wrapper),
+    db: AsyncIOMotorDatabase = Depends(get_database),
+):
+    if not hasAdminPermission(req_user):
+        msg = "Only admins are allowed to perform this action."
+        raise HTTPException(status_code=403, detail=msg)
+
+    caches = {name: cache.stats() for name, cache in CACHES.items()}
+    return {**caches, "prices": price_table.stats()}
+
+
+@router.get("/diagnostics/rate-limits")
+async def get_rate_limit_stats(req_user=Depends(auth_handler.user_wrapper)):
+    if not hasAdminPermission(req_user):
+        msg = "Only admins are allowed to perform this action."
+        raise HTTPException(status_code=403, detail=msg)
+
+    return rate_limiter.stats()
@@ -0,0 +1,53 @@
+from datetime import datetime, timedelta
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from app.accounts.permissions import hasAdminPermission, hasCreateProductPermission
+from app.analytics.services import get_seller_revenue, get_top_products
+from app.core.auth import AuthHandler
+from app.core.database import get_database
+
+auth_handler = AuthHandler()
+router = APIRouter(prefix="/analytics", tags=["Analytics"])
+
+
+def get_seller_scope(req_user, seller_id):
+    """
+    Admins may look at any seller (or all of them), wholesalers only at
+    their own sales.
+    """
+    if not hasCreateProductPermission(req_user):
+        msg = "Only wholesalers or admins can perform this action."
+        raise HTTPException(status_code=403, detail=msg)
+
+    if hasAdminPermission(req_user):
+        return seller_id
+    return str(req_user["_id"])
+
+
+@router.get("/revenue")
+async def revenue_per_seller_per_day(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    seller_id: Optional[str] = None,
+    req_user=Depends(auth_handler.user_wrapper),
+    db: AsyncIOMotorDatabase = Depends(get_database),
+):
+    seller_id = get_seller_scope(req_user, seller_id)
+    end = end or datetime.now()
+    start = start or end - timedelta(days=30)
+    return await get_seller_revenue(db, start, end, seller_id)
+
+
+@router.get("/top-products")
+async def top_products(
+    days: int = Query(7, ge=1, le=366),
+    limit: int = Query(10, ge=1, le=100),
+    seller_id: Optional[str] = None,
+    req_user=Depends(auth_handler.user_wrapper),
+    db: AsyncIOMotorDatabase = Depends(get_database),
+):
+    seller_id = get_seller_scope(req_user, seller_id)
+    return await get_top_products(db, days, limit, seller_id)
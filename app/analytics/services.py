@@ -0,0 +1,167 @@
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from pymongo import IndexModel, UpdateOne
+
+from app.core.indexes import register_indexes, register_query
+from app.orders.schemas import OrderStatus
+
+register_indexes(
+    "sales_rollups",
+    [
+        IndexModel(
+            [("seller_id", 1), ("day", 1), ("product_id", 1)],
+            name="seller_day_product",
+            unique=True,
+        ),
+        IndexModel([("day", 1)], name="day"),
+    ],
+)
+register_query(
+    "seller_revenue",
+    "sales_rollups",
+    {"seller_id": "seller", "day": {"$gte": datetime(2024, 1, 1)}},
+)
+
+
+def rollup_day(value: datetime) -> datetime:
+    return datetime(value.year, value.month, value.day)
+
+
+def rollup_operations(order, items, sign: int = 1) -> list:
+    """
+    The rollup upserts that add (sign=1) or remove (sign=-1) order lines from
+    the (seller, product, day) rollups. The day is always the day the order
+    was placed; cancelled orders and lines with a malformed product_id are
+    not counted.
+    """
+    if order.get("status") == OrderStatus.CANCELLED:
+        return []
+
+    day = rollup_day(order["created_at"])
+    return [
+        UpdateOne(
+            {
+                "seller_id": item.get("seller_id"),
+                "product_id": item["product_id"],
+                "day": day,
+            },
+            {
+                "$inc": {
+                    "quantity": sign * item["quantity"],
+                    "revenue": sign * item["subtotal"],
+                    "lines": sign,
+                },
+                "$set": {"product_name": item["product_name"]},
+            },
+            upsert=True,
+        )
+        for item in items
+        if ObjectId.is_valid(item["product_id"])
+    ]
+
+
+async def with_sellers(db, items, session=None) -> list:
+    """
+    Lines of orders placed before seller_id was stored on them get the seller
+    from the product, the way `rebuild_sales_rollups` attributes them, so
+    incremental and rebuilt rollups agree.
+    """
+    missing = {
+        item["product_id"]
+        for item in items
+        if not item.get("seller_id") and ObjectId.is_valid(item["product_id"])
+    }
+    if not missing:
+        return list(items)
+
+    cursor = db["products"].find(
+        {"_id": {"$in": [ObjectId(id) for id in missing]}},
+        {"seller_id": 1},
+        session=session,
+    )
+    sellers = {
+        str(product["_id"]): product.get("seller_id") async for product in cursor
+    }
+    return [
+        (
+            item
+            if item.get("seller_id")
+            else {**item, "seller_id": sellers.get(item["product_id"])}
+        )
+        for item in items
+    ]
+
+
+async def update_rollups(db, order, items, sign: int = 1, session=None):
+    if order.get("status") == OrderStatus.CANCELLED or not items:
+        return
+    items = await with_sellers(db, items, session)
+    operations = rollup_operations(order, items, sign)
+    if operations:
+        await db["sales_rollups"].bulk_write(operations, ordered=False, session=session)
+
+
+async def get_seller_revenue(db, start: datetime, end: datetime, seller_id=None):
+    query = {"day": {"$gte": rollup_day(start), "$lte": rollup_day(end)}}
+    if seller_id:
+        query["seller_id"] = seller_id
+
+    pipeline = [
+        {"$match": query},
+        {
+            "$group": {
+                "_id": {"seller_id": "$seller_id", "day": "$day"},
+                "revenue": {"$sum": "$revenue"},
+                "quantity": {"$sum": "$quantity"},
+                "lines": {"$sum": "$lines"},
+            }
+        },
+        {"$sort": {"_id.day": 1, "_id.seller_id": 1}},
+        {
+            "$project": {
+                "_id": 0,
+                "seller_id": "$_id.seller_id",
+                "day": "$_id.day",
+                "revenue": 1,
+                "quantity": 1,
+                "lines": 1,
+            }
+        },
+    ]
+    return await db["sales_rollups"].aggregate(pipeline).to_list(length=None)
+
+
+async def get_top_products(db, days: int, limit: int, seller_id=None):
+    query = {"day": {"$gte": rollup_day(datetime.now() - timedelta(days=days - 1))}}
+    if seller_id:
+        query["seller_id"] = seller_id
+
+    pipeline = [
+        {"$match": query},
+        # $last below then picks the name and seller of the latest day.
+        {"$sort": {"day": 1, "_id": 1}},
+        {
+            "$group": {
+                "_id": "$product_id",
+                "product_name": {"$last": "$product_name"},
+                "seller_id": {"$last": "$seller_id"},
+                "quantity": {"$sum": "$quantity"},
+                "revenue": {"$sum": "$revenue"},
+            }
+        },
+        {"$match": {"quantity": {"$gt": 0}}},
+        {"$sort": {"quantity": -1, "revenue": -1}},
+        {"$limit": limit},
+        {
+            "$project": {
+                "_id": 0,
+                "product_id": "$_id",
+                "product_name": 1,
+                "seller_id": 1,
+                "quantity": 1,
+                "revenue": 1,
+            }
+        },
+    ]
+    return await db["sales_rollups"].aggregate(pipeline).to_list(length=None)
@@ -0,0 +1,78 @@
+import asyncio
+
+from app.core.database import get_database
+from app.orders.schemas import OrderStatus
+
+
+async def rebuild_sales_rollups(db):
+    """
+    Recompute sales_rollups from the orders collection. The aggregation runs
+    inside MongoDB and $out swaps the result in atomically. Lines with a
+    malformed product_id are left out, as `rollup_operations` does.
+    """
+    pipeline = [
+        {"$match": {"status": {"$ne": OrderStatus.CANCELLED.value}}},
+        {"$unwind": "$items"},
+        {
+            "$set": {
+                "product_oid": {
+                    "$convert": {
+                        "input": "$items.product_id",
+                        "to": "objectId",
+                        "onError": None,
+                        "onNull": None,
+                    }
+                }
+            }
+        },
+        {"$match": {"product_oid": {"$ne": None}}},
+        {
+            "$lookup": {
+                "from": "products",
+                "let": {"product_id": "$product_oid"},
+                "pipeline": [
+                    {"$match": {"$expr": {"$eq": ["$_id", "$$product_id"]}}},
+                    {"$project": {"seller_id": 1}},
+                ],
+                "as": "product",
+            }
+        },
+        {
+            "$group": {
+                "_id": {
+                    "seller_id": {
+                        "$ifNull": [
+                            "$items.seller_id",
+                            {"$first": "$product.seller_id"},
+                        ]
+                    },
+                    "product_id": "$items.product_id",
+                    "day": {"$dateTrunc": {"date": "$created_at", "unit": "day"}},
+                },
+                "product_name": {"$last": "$items.product_name"},
+                "quantity": {"$sum": "$items.quantity"},
+                "revenue": {"$sum": "$items.subtotal"},
+                "lines": {"$sum": 1},
+            }
+        },
+        {
+            "$project": {
+                "_id": 0,
+                "seller_id": "$_id.seller_id",
+                "product_id": "$_id.product_id",
+                "day": "$_id.day",
+                "product_name": 1,
+                "quantity": 1,
+                "revenue": 1,
+                "lines": 1,
+            }
+        },
+        {"$out": "sales_rollups"},
+    ]
+    await db["orders"].aggregate(pipeline).to_list(length=None)
+
+
+if __name__ == "__main__":
+    # python -m app.analytics.tasks
+    asyncio.run(rebuild_sales_rollups(get_database()))
+    print("Sales rollups rebuilt")
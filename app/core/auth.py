@@ -1,19 +1,43 @@
+import hashlib
+import time
 from datetime import datetime, timedelta
 
 import jwt
 from decouple import config
-from fastapi import HTTPException, Security
+from fastapi import Depends, HTTPException, Security
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from passlib.context import CryptContext
 
+from app.accounts.services import get_current_user
 from app.core import settings
+from app.core.cache import TTLCache
+from app.core.database import get_database
+from app.core.passwords import pwd_context
+
+
+def token_digest(token: str) -> bytes:
+    return hashlib.sha256(token.encode()).digest()
 
 
 class AuthHandler:
     security = HTTPBearer()
-    pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+    pwd_context = pwd_context
     secret = settings.SECRET_KEY
 
+    # Shared by every AuthHandler instance, each router module has its own.
+    # Verified tokens map their digest to (subject, issued_at) until they
+    # expire. issued_at is a float claim, "iat" only has whole seconds.
+    token_cache = TTLCache(
+        "tokens",
+        maxsize=settings.TOKEN_CACHE_SIZE,
+        enabled=settings.TOKEN_CACHE_ENABLED,
+    )
+    revoked_tokens = TTLCache("revoked_tokens", maxsize=settings.TOKEN_REVOCATION_SIZE)
+    revoked_subjects = TTLCache(
+        "revoked_subjects",
+        maxsize=settings.TOKEN_REVOCATION_SIZE,
+        ttl=int(settings.ACCESS_TOKEN_EXPIRE_MINUTES) * 60,
+    )
+
     def get_password_hash(self, password):
         return self.pwd_context.hash(password)
 
@@ -25,6 +49,7 @@ class AuthHandler:
             "exp": datetime.now()
             + timedelta(days=0, minutes=int(settings.ACCESS_TOKEN_EXPIRE_MINUTES)),
             "iat": datetime.now(),
+            "issued_at": time.time(),
             "sub": user_id,
         }
         return jwt.encode(payload, self.secret, algorithm="HS256")
@@ -38,14 +63,66 @@ class AuthHandler:
         }
         return jwt.encode(payload, self.secret, algorithm="HS512")
 
-    def decode_token(self, token):
+    def verify_token(self, token):
         try:
-            payload = jwt.decode(token, self.secret, algorithms=["HS256"])
-            return payload["sub"]
+            return jwt.decode(token, self.secret, algorithms=["HS256"])
         except jwt.ExpiredSignatureError:
             raise HTTPException(status_code=401, detail="Signature has expired")
         except jwt.InvalidTokenError as e:
             raise HTTPException(status_code=401, detail="Invalid token")
 
+    def decode_token(self, token):
+        """
+        Returns the token subject. A token is verified once, later requests
+        with it hit the cache until it expires or is revoked.
+        """
+        digest = token_digest(token)
+        if self.revoked_tokens.get(digest):
+            raise HTTPException(status_code=401, detail="Token has been revoked")
+
+        entry = self.token_cache.get(digest)
+        if entry is None:
+            payload = self.verify_token(token)
+            # Tokens issued before the claim existed count as revoked by
+            # any revocation of their subject.
+            entry = (payload["sub"], payload.get("issued_at", 0))
+            self.token_cache.set(digest, entry, ttl=payload["exp"] - time.time())
+
+        subject, issued_at = entry
+        revoked_at = self.revoked_subjects.get(subject)
+        if revoked_at is not None and issued_at < revoked_at:
+            raise HTTPException(status_code=401, detail="Token has been revoked")
+        return subject
+
+    def revoke_token(self, token):
+        """
+        Reject this token from now on, e.g. on logout.
+        """
+        payload = self.verify_token(token)
+        digest = token_digest(token)
+        self.token_cache.invalidate(digest)
+        self.revoked_tokens.set(digest, True, ttl=payload["exp"] - time.time())
+
+    def revoke_subject(self, subject):
+        """
+        Reject every token issued to `subject` so far, e.g. when their role
+        changes or the account is deleted. Revocations are kept in memory by
+        each worker.
+        """
+        self.revoked_subjects.set(subject, time.time())
+
     def auth_wrapper(self, auth: HTTPAuthorizationCredentials = Security(security)):
         return self.decode_token(auth.credentials)
+
+    async def user_wrapper(
+        self,
+        auth: HTTPAuthorizationCredentials = Security(security),
+        db=Depends(get_database),
+    ):
+        """
+        Like auth_wrapper, but resolves the user document as well.
+        """
+        user = await get_current_user(self.decode_token(auth.credentials), db)
+        if user is None:
+            raise HTTPException(status_code=401, detail="User not found")
+        return user
@@ -2,6 +2,7 @@ import motor.motor_asyncio
 from decouple import config
 
 from app.core import settings
+from app.core.indexes import ensure_indexes, explain_queries
 
 DATABASE_URL = settings.MONGO_DB_URL
 client = motor.motor_asyncio.AsyncIOMotorClient(DATABASE_URL)
@@ -10,7 +11,24 @@ db = client.foodnest_db
 
 async def init_db():
     print("Database connected")
+    await ensure_indexes(db)
+
+    for query in await explain_queries(db):
+        if query["collscan"]:
+            print(f"Query {query['name']} on {query['collection']} does a COLLSCAN")
 
 
 def get_database():
     return db
+
+
+async def run_in_transaction(callback):
+    """
+    Run `callback(session)` inside a transaction when MONGO_TRANSACTIONS is on
+    (replica sets only), otherwise call it without a session.
+    """
+    if not settings.MONGO_TRANSACTIONS:
+        return await callback(None)
+
+    async with await client.start_session() as session:
+        return await session.with_transaction(callback)
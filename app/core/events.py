@@ -0,0 +1,78 @@
+import asyncio
+from collections import defaultdict
+from typing import Any, Dict, Iterable, Optional, Set
+
+
+class Subscription:
+    def __init__(self, broker: "EventBroker", channels: Iterable[str], maxsize: int):
+        self.broker = broker
+        self.channels = set(channels)
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize)
+
+    async def get(self, timeout: float) -> Optional[Dict[str, Any]]:
+        """
+        Next event, or None when the subscriber was dropped for being slow.
+        Raises asyncio.TimeoutError when nothing arrived within `timeout`.
+        """
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.broker.unsubscribe(self)
+
+
+class EventBroker:
+    """
+    In-process pub/sub. Every subscriber has a bounded queue; publishing never
+    waits, a subscriber whose queue is full is dropped instead of slowing
+    down the publisher or growing without bound.
+    """
+
+    def __init__(self, maxsize: int = 100):
+        self.maxsize = maxsize
+        self.published = 0
+        self.dropped = 0
+        self._channels: Dict[str, Set[Subscription]] = defaultdict(set)
+
+    def subscribe(self, channels: Iterable[str]) -> Subscription:
+        subscription = Subscription(self, channels, self.maxsize)
+        for channel in subscription.channels:
+            self._channels[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        for channel in subscription.channels:
+            subscribers = self._channels.get(channel)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._channels[channel]
+
+    def _drop(self, subscription: Subscription):
+        self.unsubscribe(subscription)
+        self.dropped += 1
+        while not subscription.queue.empty():
+            subscription.queue.get_nowait()
+        subscription.queue.put_nowait(None)
+
+    def publish(self, channels: Iterable[str], event: Dict[str, Any]):
+        subscriptions = set()
+        for channel in channels:
+            subscriptions.update(self._channels.get(channel, ()))
+
+        self.published += 1
+        for subscription in subscriptions:
+            try:
+                subscription.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                self._drop(subscription)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "channels": len(self._channels),
+            "subscribers": len({s for subs in self._channels.values() for s in subs}),
+            "published": self.published,
+            "dropped": self.dropped,
+        }
@@ -0,0 +1,57 @@
+import csv
+import io
+import json
+from enum import Enum
+from typing import AsyncIterator, List
+
+from fastapi.responses import StreamingResponse
+
+from app.core.helpers import transform_mongo_data
+
+EXPORT_BATCH_SIZE = 500
+
+
+class ExportFormat(str, Enum):
+    NDJSON = "ndjson"
+    CSV = "csv"
+
+
+async def iter_ndjson(cursor) -> AsyncIterator[str]:
+    async for document in cursor:
+        yield json.dumps(transform_mongo_data(document), default=str) + "\n"
+
+
+async def iter_csv(cursor, fields: List[str]) -> AsyncIterator[str]:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=fields, extrasaction="ignore")
+    writer.writeheader()
+    async for document in cursor:
+        writer.writerow(transform_mongo_data(document))
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def export_response(
+    cursor, format: ExportFormat, filename: str, fields: List[str]
+) -> StreamingResponse:
+    """
+    Stream a Motor cursor to the client one batch at a time, so memory stays
+    flat whatever the size of the export.
+    Args:
+        cursor: The Motor cursor to export.
+        format: Either NDJSON or CSV.
+        filename: The attachment name, without extension.
+        fields: The CSV columns; NDJSON rows carry the whole document.
+    """
+    cursor = cursor.batch_size(EXPORT_BATCH_SIZE)
+    if format == ExportFormat.CSV:
+        content, media_type = iter_csv(cursor, fields), "text/csv"
+    else:
+        content, media_type = iter_ndjson(cursor), "application/x-ndjson"
+
+    headers = {"Content-Disposition": f"attachment; filename={filename}.{format.value}"}
+    return StreamingResponse(content, media_type=media_type, headers=headers)
@@ -1,5 +1,9 @@
+import json
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional
+
 from bson import ObjectId
-from typing import Any
+from fastapi import Response
 
 
 def transform_mongo_data(data: Any) -> Any:
@@ -16,3 +20,61 @@ def transform_mongo_data(data: Any) -> Any:
     if isinstance(data, ObjectId):
         return str(data)
     return data
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, ObjectId):
+        return str(value)
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def json_response(content: Any) -> Response:
+    """
+    Encode already serialized data straight to JSON bytes, skipping
+    FastAPI's jsonable_encoder pass over the payload.
+    """
+    body = json.dumps(
+        content,
+        default=_json_default,
+        ensure_ascii=False,
+        allow_nan=False,
+        separators=(",", ":"),
+    ).encode("utf-8")
+    return Response(content=body, media_type="application/json")
+
+
+class MongoSerializer:
+    """
+    Serializer compiled once per response schema. It only touches the fields
+    it is told about: `_id` is renamed to `id`, `object_ids` are turned into
+    strings and `nested` fields (dicts or lists of dicts) use their own
+    serializer. Produces the same output as `transform_mongo_data` for
+    documents matching the schema, without walking every value.
+    """
+
+    def __init__(
+        self, object_ids=(), nested: Optional[Dict[str, "MongoSerializer"]] = None
+    ):
+        self.object_ids = tuple(object_ids)
+        self.nested = tuple((nested or {}).items())
+
+    def __call__(self, document: Dict) -> Dict:
+        data = dict(document)
+        if "_id" in data:
+            data["id"] = str(data.pop("_id"))
+        for field in self.object_ids:
+            value = data.get(field)
+            if isinstance(value, ObjectId):
+                data[field] = str(value)
+        for field, serializer in self.nested:
+            value = data.get(field)
+            if isinstance(value, list):
+                data[field] = [serializer(item) for item in value]
+            elif isinstance(value, dict):
+                data[field] = serializer(value)
+        return data
+
+    def many(self, documents: List[Dict]) -> List[Dict]:
+        return [self(document) for document in documents]
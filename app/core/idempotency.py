@@ -0,0 +1,200 @@
+import asyncio
+import hashlib
+import json
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from bson import ObjectId
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from pymongo import IndexModel
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+from app.core import settings
+from app.core.cache import TTLCache
+from app.core.indexes import register_indexes
+
+logger = logging.getLogger(__name__)
+
+COLLECTION = "idempotency_keys"
+STORE_ATTEMPTS = 5
+
+register_indexes(
+    COLLECTION,
+    [
+        IndexModel(
+            "created_at",
+            name="created_at_ttl",
+            expireAfterSeconds=settings.IDEMPOTENCY_TTL,
+        )
+    ],
+)
+
+idempotency_cache = TTLCache(
+    "idempotency",
+    maxsize=settings.IDEMPOTENCY_CACHE_SIZE,
+    ttl=settings.IDEMPOTENCY_TTL,
+)
+_in_flight: Dict[str, asyncio.Future] = {}
+
+
+def _fingerprint(payload: Any) -> str:
+    body = json.dumps(jsonable_encoder(payload), sort_keys=True)
+    return hashlib.sha256(body.encode()).hexdigest()
+
+
+def _replay(entry: Dict, fingerprint: str) -> Any:
+    if entry["fingerprint"] != fingerprint:
+        raise HTTPException(
+            status_code=422,
+            detail="Idempotency-Key was already used with a different request.",
+        )
+    return entry["response"]
+
+
+async def _claim(
+    db, cache_key: str, fingerprint: str, owner: ObjectId
+) -> Optional[Dict]:
+    """
+    Claim the key for this request. Returns the stored entry instead when the
+    key is already done; a pending claim not renewed for IDEMPOTENCY_LEASE
+    belongs to a request that died and is taken over, any other one is a 409.
+    """
+    now = datetime.now()
+    claim = {
+        "fingerprint": fingerprint,
+        "status": "pending",
+        "claimed_at": now,
+        "owner": owner,
+    }
+    try:
+        await db[COLLECTION].insert_one({"_id": cache_key, **claim, "created_at": now})
+        return None
+    except DuplicateKeyError:
+        stored = await db[COLLECTION].find_one({"_id": cache_key})
+
+    if stored and stored["status"] == "done":
+        return {"fingerprint": stored["fingerprint"], "response": stored["response"]}
+
+    lease = timedelta(seconds=settings.IDEMPOTENCY_LEASE)
+    if stored and stored.get("claimed_at", stored["created_at"]) < now - lease:
+        taken = await db[COLLECTION].find_one_and_update(
+            {
+                "_id": cache_key,
+                "status": "pending",
+                "claimed_at": stored.get("claimed_at"),
+            },
+            {"$set": claim},
+        )
+        if taken:
+            return None
+
+    raise HTTPException(
+        status_code=409,
+        detail="A request with this Idempotency-Key is in progress.",
+    )
+
+
+async def _renew_claim(db, cache_key: str, owner: ObjectId):
+    """
+    Keep the claim from looking abandoned while a slow handler still runs.
+    """
+    while True:
+        await asyncio.sleep(settings.IDEMPOTENCY_LEASE / 3)
+        try:
+            await db[COLLECTION].update_one(
+                {"_id": cache_key, "status": "pending", "owner": owner},
+                {"$set": {"claimed_at": datetime.now()}},
+            )
+        except PyMongoError:
+            logger.warning("Could not renew idempotency claim %s", cache_key)
+
+
+async def _store_response(db, cache_key: str, response: Any):
+    """
+    The handler already ran, so the claim is never given back: the write is
+    retried, and when it still fails the key stays pending.
+    """
+    for attempt in range(STORE_ATTEMPTS):
+        try:
+            await db[COLLECTION].update_one(
+                {"_id": cache_key}, {"$set": {"status": "done", "response": response}}
+            )
+            return
+        except PyMongoError:
+            if attempt == STORE_ATTEMPTS - 1:
+                logger.exception("Could not store idempotent response %s", cache_key)
+                return
+            await asyncio.sleep(0.1 * 2**attempt)
+
+
+async def idempotent(
+    db,
+    key: Optional[str],
+    scope: str,
+    payload: Any,
+    handler: Callable[[], Awaitable[Any]],
+) -> Any:
+    """
+    Run `handler` at most once per (scope, Idempotency-Key). Retries get the
+    stored response back: from the in-process LRU, from the TTL-indexed
+    idempotency_keys collection, or by waiting on the request still in flight
+    in this process. Failed or cancelled requests release the key so they can
+    be retried; once the handler returned the key is never released, even if
+    the request is cancelled while the response is stored.
+    """
+    if not key:
+        return await handler()
+
+    cache_key = f"{scope}:{key}"
+    fingerprint = _fingerprint(payload)
+
+    entry = idempotency_cache.get(cache_key)
+    if entry is not None:
+        return _replay(entry, fingerprint)
+
+    if cache_key in _in_flight:
+        entry = await asyncio.shield(_in_flight[cache_key])
+        return _replay(entry, fingerprint)
+
+    future = asyncio.get_running_loop().create_future()
+    _in_flight[cache_key] = future
+    owner = ObjectId()
+    claimed, renewal = False, None
+    try:
+        entry = await _claim(db, cache_key, fingerprint, owner)
+        if entry is None:
+            claimed = True
+            renewal = asyncio.create_task(_renew_claim(db, cache_key, owner))
+            response = jsonable_encoder(await handler())
+            claimed = False
+            renewal.cancel()
+            entry = {"fingerprint": fingerprint, "response": response}
+            idempotency_cache.set(cache_key, entry)
+            future.set_result(entry)
+            # Shielded: a client gone at this point must not lose the response.
+            await asyncio.shield(_store_response(db, cache_key, response))
+        else:
+            idempotency_cache.set(cache_key, entry)
+            future.set_result(entry)
+        return _replay(entry, fingerprint)
+    except BaseException as e:
+        if claimed:
+            # Shielded so the key is released even when we were cancelled.
+            await asyncio.shield(
+                db[COLLECTION].delete_one({"_id": cache_key, "owner": owner})
+            )
+        if not future.done():
+            if not isinstance(e, Exception):
+                e = HTTPException(
+                    status_code=409,
+                    detail="The request with this Idempotency-Key was interrupted.",
+                )
+            future.set_exception(e)
+            future.exception()
+        raise
+    finally:
+        if renewal is not None:
+            renewal.cancel()
+        _in_flight.pop(cache_key, None)
@@ -0,0 +1,73 @@
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+from pymongo import IndexModel
+from pymongo.errors import OperationFailure
+
+INDEX_REGISTRY: Dict[str, List[IndexModel]] = defaultdict(list)
+CANONICAL_QUERIES: List[Dict[str, Any]] = []
+
+
+def register_indexes(collection: str, indexes: List[IndexModel]):
+    """
+    Declare the indexes a module needs, they are created by `ensure_indexes`.
+    """
+    INDEX_REGISTRY[collection].extend(indexes)
+
+
+def register_query(
+    name: str,
+    collection: str,
+    query: Dict[str, Any],
+    sort: Optional[List] = None,
+):
+    """
+    Declare the canonical query of a route so `explain_queries` can check it.
+    """
+    CANONICAL_QUERIES.append(
+        {"name": name, "collection": collection, "query": query, "sort": sort}
+    )
+
+
+async def ensure_indexes(db):
+    """
+    Create every registered index. Mongo skips indexes that already exist
+    with the same spec, so this is safe to run on every startup.
+    """
+    for collection, indexes in INDEX_REGISTRY.items():
+        try:
+            await db[collection].create_indexes(indexes)
+        except OperationFailure as e:
+            print(f"Could not create indexes on {collection}: {e}")
+
+
+def _stages(plan: Any) -> List[str]:
+    if isinstance(plan, list):
+        return [stage for item in plan for stage in _stages(item)]
+    if isinstance(plan, dict):
+        found = [plan["stage"]] if "stage" in plan else []
+        return found + [stage for value in plan.values() for stage in _stages(value)]
+    return []
+
+
+async def explain_queries(db) -> List[Dict[str, Any]]:
+    """
+    Run explain() on every canonical query and flag the ones doing a COLLSCAN.
+    """
+    report = []
+    for canonical in CANONICAL_QUERIES:
+        cursor = db[canonical["collection"]].find(canonical["query"])
+        if canonical["sort"]:
+            cursor = cursor.sort(canonical["sort"])
+
+        explain = await cursor.explain()
+        stages = _stages(explain.get("queryPlanner", {}).get("winningPlan", {}))
+        report.append(
+            {
+                "name": canonical["name"],
+                "collection": canonical["collection"],
+                "stages": stages,
+                "collscan": "COLLSCAN" in stages,
+            }
+        )
+    return report
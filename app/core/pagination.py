@@ -1,4 +1,35 @@
-from typing import Any, Dict, List, Optional
+import asyncio
+import base64
+import hashlib
+import hmac
+from typing import Any, Dict, List, Optional, Tuple
+
+from bson import json_util
+from fastapi import HTTPException
+
+from app.core import settings
+from app.core.cache import TTLCache
+
+SECRET = settings.SECRET_KEY.encode()
+CURSOR_HELP = (
+    "Opt in to cursor pagination: send an empty value for the first page, "
+    "then the `next_cursor` from the previous response."
+)
+
+page_totals = TTLCache(
+    "page_totals",
+    maxsize=settings.PAGE_COUNT_CACHE_SIZE,
+    ttl=settings.PAGE_COUNT_CACHE_TTL,
+)
+
+
+def page_meta(total_items: int, page: int, page_size: int) -> Dict[str, Any]:
+    return {
+        "page": page,
+        "page_size": page_size,
+        "total_items": total_items,
+        "total_pages": (total_items + page_size - 1) // page_size,
+    }
 
 
 def paginate(
@@ -15,18 +46,173 @@ def paginate(
     Returns:
         A dictionary containing paginated results and metadata.
     """
-    total_items = len(items)
-    total_pages = (total_items + page_size - 1) // page_size
     start = (page - 1) * page_size
     end = start + page_size
     paginated_items = items[start:end]
 
     return {
         "items": paginated_items,
-        "meta": {
-            "page": page,
-            "page_size": page_size,
-            "total_items": total_items,
-            "total_pages": total_pages,
-        },
+        "meta": page_meta(len(items), page, page_size),
+    }
+
+
+async def count_total(collection, query: Dict[str, Any]) -> Tuple[int, bool]:
+    """
+    Count the documents matching `query`, stopping at PAGE_COUNT_LIMIT so the
+    count is a bounded index scan. Every page of a listing asks for the same
+    total, so it is cached for PAGE_COUNT_CACHE_TTL seconds.
+    Returns:
+        The count and whether it hit the limit.
+    """
+    key = (collection.name, json_util.dumps(query, sort_keys=True))
+    total = page_totals.get(key)
+    if total is None:
+        limit = settings.PAGE_COUNT_LIMIT
+        count = await collection.count_documents(query, limit=limit)
+        total = (count, count >= limit)
+        page_totals.set(key, total)
+    return total
+
+
+async def paginate_aggregate(
+    collection,
+    pipeline: List[Dict[str, Any]],
+    page: int = 1,
+    page_size: int = 10,
+    page_stages: Optional[List[Dict[str, Any]]] = None,
+) -> Dict[str, Any]:
+    """
+    Paginate an aggregation pipeline inside MongoDB. Only one page of
+    documents ever leaves the database; the total comes from `count_total`
+    on the leading $match, so it is capped at PAGE_COUNT_LIMIT
+    (`total_capped` in the metadata).
+    Args:
+        collection: The Motor collection to aggregate on.
+        pipeline: The stages that select (and sort) the documents, starting
+            with their $match.
+        page: The current page number.
+        page_size: The number of items per page.
+        page_stages: Stages applied to the page only, e.g. a $lookup, so they
+            don't run for every matching document.
+    Returns:
+        A dictionary with the same shape as `paginate`.
+    """
+    start = (page - 1) * page_size
+    query = pipeline[0].get("$match", {}) if pipeline else {}
+    page_pipeline = [
+        *pipeline,
+        {"$skip": start},
+        {"$limit": page_size},
+        *(page_stages or []),
+    ]
+    items, (total_items, capped) = await asyncio.gather(
+        collection.aggregate(page_pipeline).to_list(length=page_size),
+        count_total(collection, query),
+    )
+
+    return {
+        "items": items,
+        "meta": {**page_meta(total_items, page, page_size), "total_capped": capped},
+    }
+
+
+def encode_cursor(sort_key: str, values: List[Any]) -> str:
+    """
+    Build an opaque, signed cursor from the sort key values of the last item.
+    """
+    payload = json_util.dumps({"k": sort_key, "v": values}).encode()
+    signature = hmac.new(SECRET, payload, hashlib.sha256).digest()[:16]
+    return base64.urlsafe_b64encode(signature + payload).decode().rstrip("=")
+
+
+def decode_cursor(sort_key: str, cursor: str) -> List[Any]:
+    """
+    Verify a cursor produced by `encode_cursor` and return its sort key values.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        signature, payload = raw[:16], raw[16:]
+        expected = hmac.new(SECRET, payload, hashlib.sha256).digest()[:16]
+        if not hmac.compare_digest(signature, expected):
+            raise ValueError("Bad signature")
+        data = json_util.loads(payload)
+        if data["k"] != sort_key:
+            raise ValueError("Cursor was built for another sort key")
+        return data["v"]
+    except (ValueError, TypeError, KeyError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def cursor_query(sort_key: str, values: List[Any], direction: int = 1) -> Dict:
+    """
+    Turn the (sort_key, _id) values of a cursor into a range query.
+    """
+    op = "$gt" if direction == 1 else "$lt"
+    if sort_key == "_id":
+        return {"_id": {op: values[-1]}}
+    value, last_id = values
+    return {
+        "$or": [
+            {sort_key: {op: value}},
+            {sort_key: value, "_id": {op: last_id}},
+        ]
+    }
+
+
+async def paginate_cursor(
+    collection,
+    query: Dict[str, Any],
+    cursor: Optional[str] = None,
+    page_size: int = 10,
+    sort_key: str = "_id",
+    direction: int = 1,
+    page_stages: Optional[List[Dict[str, Any]]] = None,
+) -> Dict[str, Any]:
+    """
+    Keyset pagination: every page is a range scan on (sort_key, _id), so deep
+    pages cost the same as the first one and concurrent writes don't shift rows.
+    Args:
+        collection: The Motor collection to read from.
+        query: The filter selecting the documents.
+        cursor: The `next_cursor` of the previous page, empty for the first page.
+        page_size: The number of items per page.
+        sort_key: The field to order by, `_id` is used as a tie breaker.
+        direction: 1 for ascending, -1 for descending.
+        page_stages: Stages applied to the page only, e.g. a $lookup.
+    Returns:
+        A dictionary with the page items and a `next_cursor` in the metadata.
+    """
+    if cursor:
+        query = {
+            "$and": [
+                query,
+                cursor_query(sort_key, decode_cursor(sort_key, cursor), direction),
+            ]
+        }
+
+    sort = (
+        {"_id": direction}
+        if sort_key == "_id"
+        else {sort_key: direction, "_id": direction}
+    )
+    pipeline = [
+        {"$match": query},
+        {"$sort": sort},
+        {"$limit": page_size + 1},
+        *(page_stages or []),
+    ]
+    items = await collection.aggregate(pipeline).to_list(length=page_size + 1)
+
+    next_cursor = None
+    if len(items) > page_size:
+        items = items[:page_size]
+        last = items[-1]
+        values = (
+            [last["_id"]] if sort_key == "_id" else [last.get(sort_key), last["_id"]]
+        )
+        next_cursor = encode_cursor(sort_key, values)
+
+    return {
+        "items": items,
+        "meta": {"page_size": page_size, "next_cursor": next_cursor},
     }
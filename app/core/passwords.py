@@ -0,0 +1,86 @@
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional, Tuple
+
+from fastapi import HTTPException
+from passlib.context import CryptContext
+
+from app.core import settings
+
+# Hashes made with any other work factor are flagged by verify_and_update,
+# so changing PASSWORD_HASH_ROUNDS rehashes every password at next login.
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=settings.PASSWORD_HASH_ROUNDS,
+    bcrypt__min_rounds=settings.PASSWORD_HASH_ROUNDS,
+    bcrypt__max_rounds=settings.PASSWORD_HASH_ROUNDS,
+)
+
+
+def hash_password(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def verify_password(password: str, hashed: str) -> Tuple[bool, Optional[str]]:
+    """
+    Returns whether the password matches and, when the stored hash was made
+    with another work factor, its replacement.
+    """
+    return pwd_context.verify_and_update(password, hashed)
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt on a bounded process pool. A hash costs a few hundred ms of
+    CPU, on the event loop that would stall every other request of the
+    worker. Past `max_pending` calls in flight it answers 503 instead of
+    queueing without bound.
+    """
+
+    def __init__(self, workers: int, max_pending: int):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.pending = 0
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        # Created on first use so importing the app does not start processes.
+        # Workers come from a forkserver rather than a fork of the running
+        # event loop, its threads and its open Mongo connections.
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                self.workers, mp_context=multiprocessing.get_context("forkserver")
+            )
+        return self._executor
+
+    async def _run(self, function, *args):
+        if self.pending >= self.max_pending:
+            raise HTTPException(
+                status_code=503, detail="Too many logins in progress, retry later."
+            )
+
+        self.pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, function, *args)
+        finally:
+            self.pending -= 1
+
+    async def hash(self, password: str) -> str:
+        return await self._run(hash_password, password)
+
+    async def verify(self, password: str, hashed: str) -> Tuple[bool, Optional[str]]:
+        return await self._run(verify_password, password, hashed)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+password_hasher = PasswordHasher(
+    settings.PASSWORD_HASH_WORKERS, settings.PASSWORD_HASH_MAX_PENDING
+)
@@ -0,0 +1,254 @@
+import json
+import math
+import time
+from collections import OrderedDict, defaultdict
+from typing import Dict, NamedTuple, Optional, Tuple
+
+from starlette.responses import JSONResponse
+
+from app.core import settings
+
+Rate = Tuple[int, float]
+
+
+def parse_rate(value: str) -> Optional[Rate]:
+    """
+    "10/60" is 10 requests per 60 seconds, an empty value means no limit.
+    """
+    if not value:
+        return None
+    count, seconds = value.split("/")
+    return int(count), float(seconds)
+
+
+class RouteLimit(NamedTuple):
+    ip: Optional[Rate] = None
+    account: Optional[Rate] = None
+    max_concurrent: Optional[int] = None
+
+
+class BucketStore:
+    """
+    Token buckets keyed by (route, scope, value), kept as [tokens, stamp]
+    pairs in an LRU bounded by `maxsize`. An evicted bucket comes back full,
+    which only ever errs on the side of letting a request through.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.evictions = 0
+        self._buckets: "OrderedDict[tuple, list]" = OrderedDict()
+
+    def _bucket(self, key: tuple, rate: Rate, now: float) -> list:
+        count, seconds = rate
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [float(count), now]
+            while len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+                self.evictions += 1
+        else:
+            self._buckets.move_to_end(key)
+            bucket[0] = min(count, bucket[0] + (now - bucket[1]) * count / seconds)
+            bucket[1] = now
+        return bucket
+
+    def wait(self, key: tuple, rate: Rate, now: float) -> float:
+        """
+        Returns 0 when a token is available, otherwise the seconds until the
+        next one. Takes nothing.
+        """
+        count, seconds = rate
+        bucket = self._bucket(key, rate, now)
+        if bucket[0] >= 1:
+            return 0
+        return (1 - bucket[0]) * seconds / count
+
+    def take(self, key: tuple, rate: Rate, now: float) -> float:
+        """
+        Like `wait`, but takes the token when one is available.
+        """
+        wait = self.wait(key, rate, now)
+        if not wait:
+            self._buckets[key][0] -= 1
+        return wait
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class RateLimiter:
+    def __init__(self, maxsize: int, enabled: bool = True):
+        self.enabled = enabled
+        self.buckets = BucketStore(maxsize)
+        self.limits: Dict[Tuple[str, str], RouteLimit] = {}
+        self.in_flight: Dict[str, int] = defaultdict(int)
+        self.counters: Dict[str, Dict[str, int]] = defaultdict(
+            lambda: {
+                "allowed": 0,
+                "limited_ip": 0,
+                "limited_account": 0,
+                "shed": 0,
+                "too_large": 0,
+            }
+        )
+
+    def register(self, method: str, path: str, limit: RouteLimit):
+        self.limits[(method, path)] = limit
+
+    def _rejected(self, route, limit, ip, account, now) -> Optional[tuple]:
+        counters = self.counters[route]
+        if limit.ip and ip:
+            wait = self.buckets.wait((route, "ip", ip), limit.ip, now)
+            if wait:
+                counters["limited_ip"] += 1
+                return 429, "Too many requests, retry later.", wait
+        if limit.account and account:
+            wait = self.buckets.wait((route, "account", account), limit.account, now)
+            if wait:
+                counters["limited_account"] += 1
+                return 429, "Too many attempts for this account, retry later.", wait
+        if limit.max_concurrent and self.in_flight[route] >= limit.max_concurrent:
+            counters["shed"] += 1
+            return 503, "Server busy, retry later.", 1
+        return None
+
+    def precheck(self, route: str, limit: RouteLimit, ip) -> Optional[tuple]:
+        """
+        The checks that need no body, run before reading it. Takes nothing.
+        """
+        return self._rejected(route, limit, ip, None, time.monotonic())
+
+    def check(self, route: str, limit: RouteLimit, ip, account) -> Optional[tuple]:
+        """
+        Returns None when the request may go on, else (status, detail,
+        retry_after). Tokens are only taken from the buckets of a request
+        that is let through.
+        """
+        now = time.monotonic()
+        rejected = self._rejected(route, limit, ip, account, now)
+        if rejected:
+            return rejected
+        if limit.ip and ip:
+            self.buckets.take((route, "ip", ip), limit.ip, now)
+        if limit.account and account:
+            self.buckets.take((route, "account", account), limit.account, now)
+        self.counters[route]["allowed"] += 1
+        return None
+
+    def stats(self):
+        return {
+            "enabled": self.enabled,
+            "buckets": len(self.buckets),
+            "maxsize": self.buckets.maxsize,
+            "evictions": self.buckets.evictions,
+            "routes": {
+                route: {**counters, "in_flight": self.in_flight[route]}
+                for route, counters in self.counters.items()
+            },
+        }
+
+
+def _account(body: bytes) -> Optional[str]:
+    try:
+        email = json.loads(body).get("email")
+    except (ValueError, AttributeError):
+        return None
+    return email.strip().lower() if isinstance(email, str) else None
+
+
+async def _read_body(receive, max_size: int) -> Optional[list]:
+    """
+    The request messages, or None once the body grows past `max_size`.
+    """
+    messages, size, more = [], 0, True
+    while more:
+        message = await receive()
+        size += len(message.get("body", b""))
+        if size > max_size:
+            return None
+        messages.append(message)
+        more = message.get("more_body", False)
+    return messages
+
+
+def _content_length(scope) -> int:
+    for name, value in scope.get("headers", []):
+        if name == b"content-length":
+            try:
+                return int(value)
+            except ValueError:
+                return 0
+    return 0
+
+
+def _replay(messages: list, receive):
+    async def replay():
+        if messages:
+            return messages.pop(0)
+        return await receive()
+
+    return replay
+
+
+class RateLimitMiddleware:
+    """
+    Applies the registered RouteLimits before the request reaches the route,
+    so a rejected login costs no bcrypt and no database work. For account
+    limits the body is read, up to `max_body` bytes, to find the account and
+    replayed to the app; the IP and concurrency limits are checked first so
+    a blocked client never gets that far.
+    """
+
+    def __init__(self, app, limiter: RateLimiter, max_body: Optional[int] = None):
+        self.app = app
+        self.limiter = limiter
+        self.max_body = settings.RATE_LIMIT_MAX_BODY if max_body is None else max_body
+
+    async def _reject(self, scope, receive, send, status, detail, retry_after=None):
+        headers = {}
+        if retry_after is not None:
+            headers["Retry-After"] = str(math.ceil(retry_after))
+        response = JSONResponse({"detail": detail}, status_code=status, headers=headers)
+        await response(scope, receive, send)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.limiter.enabled:
+            return await self.app(scope, receive, send)
+
+        limit = self.limiter.limits.get((scope["method"], scope["path"]))
+        if limit is None:
+            return await self.app(scope, receive, send)
+
+        route = scope["path"]
+        client = scope.get("client")
+        ip = client and client[0]
+
+        account = None
+        if limit.account:
+            rejected = self.limiter.precheck(route, limit, ip)
+            if rejected:
+                return await self._reject(scope, receive, send, *rejected)
+
+            messages = None
+            if _content_length(scope) <= self.max_body:
+                messages = await _read_body(receive, self.max_body)
+            if messages is None:
+                self.limiter.counters[route]["too_large"] += 1
+                detail = "Request body too large."
+                return await self._reject(scope, receive, send, 413, detail)
+            account = _account(b"".join(m.get("body", b"") for m in messages))
+            receive = _replay(messages, receive)
+
+        rejected = self.limiter.check(route, limit, ip, account)
+        if rejected:
+            return await self._reject(scope, receive, send, *rejected)
+
+        self.limiter.in_flight[route] += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.limiter.in_flight[route] -= 1
+
+
+rate_limiter = RateLimiter(settings.RATE_LIMIT_BUCKETS, settings.RATE_LIMIT_ENABLED)
@@ -0,0 +1,60 @@
+import bisect
+from typing import Dict, List, Tuple
+
+
+class PrefixIndex:
+    """
+    Sorted-array prefix index for autocomplete. Every word of a name is a key,
+    so "brown rice" is found by both "bro" and "ri". Lookups are a binary
+    search, updates an insort, and nothing touches the database.
+    """
+
+    def __init__(self):
+        self._keys: List[Tuple[str, str]] = []
+        self._names: Dict[str, str] = {}
+
+    @staticmethod
+    def _tokens(name: str) -> List[str]:
+        words = name.lower().split()
+        return sorted({" ".join(words[i:]) for i in range(len(words))})
+
+    def add(self, id: str, name: str):
+        self.remove(id)
+        self._names[id] = name
+        for token in self._tokens(name):
+            bisect.insort(self._keys, (token, id))
+
+    def remove(self, id: str):
+        name = self._names.pop(id, None)
+        if name is None:
+            return
+        for token in self._tokens(name):
+            index = bisect.bisect_left(self._keys, (token, id))
+            if index < len(self._keys) and self._keys[index] == (token, id):
+                del self._keys[index]
+
+    def rebuild(self, entries: List[Tuple[str, str]]):
+        self._names = dict(entries)
+        self._keys = sorted(
+            (token, id) for id, name in entries for token in self._tokens(name)
+        )
+
+    def search(self, prefix: str, limit: int = 10) -> List[Dict[str, str]]:
+        prefix = " ".join(prefix.lower().split())
+        if not prefix:
+            return []
+
+        results, seen = [], set()
+        index = bisect.bisect_left(self._keys, (prefix, ""))
+        while index < len(self._keys) and len(results) < limit:
+            token, id = self._keys[index]
+            if not token.startswith(prefix):
+                break
+            if id not in seen:
+                seen.add(id)
+                results.append({"id": id, "name": self._names[id]})
+            index += 1
+        return results
+
+    def __len__(self):
+        return len(self._names)
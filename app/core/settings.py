@@ -10,3 +10,61 @@ CLOUDINARY_API_KEY = config("CLOUDINARY_API_KEY")
 CLOUDINARY_API_SECRET = config("CLOUDINARY_API_SECRET")
 
 MAILGUN_API_KEY = config("MAILGUN_API_KEY")
+
+PRODUCT_CACHE_ENABLED = config("PRODUCT_CACHE_ENABLED", default=True, cast=bool)
+PRODUCT_CACHE_SIZE = config("PRODUCT_CACHE_SIZE", default=5000, cast=int)
+PRODUCT_CACHE_TTL = config("PRODUCT_CACHE_TTL", default=300, cast=int)
+
+USER_CACHE_ENABLED = config("USER_CACHE_ENABLED", default=True, cast=bool)
+USER_CACHE_SIZE = config("USER_CACHE_SIZE", default=10000, cast=int)
+USER_CACHE_TTL = config("USER_CACHE_TTL", default=30, cast=int)
+
+MFA_QR_CACHE_SIZE = config("MFA_QR_CACHE_SIZE", default=1000, cast=int)
+MFA_QR_CACHE_TTL = config("MFA_QR_CACHE_TTL", default=600, cast=int)
+
+# Offset pages count their total up to this many documents, cached briefly.
+PAGE_COUNT_LIMIT = config("PAGE_COUNT_LIMIT", default=10000, cast=int)
+PAGE_COUNT_CACHE_SIZE = config("PAGE_COUNT_CACHE_SIZE", default=1000, cast=int)
+PAGE_COUNT_CACHE_TTL = config("PAGE_COUNT_CACHE_TTL", default=30, cast=int)
+
+PRODUCT_LIST_IMAGES = config("PRODUCT_LIST_IMAGES", default=3, cast=int)
+PRODUCT_THUMBNAIL_SIZE = config("PRODUCT_THUMBNAIL_SIZE", default=200, cast=int)
+
+UPLOAD_STORAGE = config("UPLOAD_STORAGE", default="cloudinary")
+UPLOAD_LOCAL_DIR = config("UPLOAD_LOCAL_DIR", default="static/uploads")
+UPLOAD_WORKERS = config("UPLOAD_WORKERS", default=4, cast=int)
+UPLOAD_MAX_PENDING = config("UPLOAD_MAX_PENDING", default=64, cast=int)
+UPLOAD_RETRIES = config("UPLOAD_RETRIES", default=3, cast=int)
+UPLOAD_STALE_AFTER = config("UPLOAD_STALE_AFTER", default=600, cast=int)
+
+MONGO_TRANSACTIONS = config("MONGO_TRANSACTIONS", default=False, cast=bool)
+
+IDEMPOTENCY_TTL = config("IDEMPOTENCY_TTL", default=86400, cast=int)
+IDEMPOTENCY_CACHE_SIZE = config("IDEMPOTENCY_CACHE_SIZE", default=10000, cast=int)
+IDEMPOTENCY_LEASE = config("IDEMPOTENCY_LEASE", default=60, cast=int)
+
+ORDER_EVENTS_SOURCE = config("ORDER_EVENTS_SOURCE", default="local")
+EVENTS_QUEUE_SIZE = config("EVENTS_QUEUE_SIZE", default=100, cast=int)
+EVENTS_HEARTBEAT = config("EVENTS_HEARTBEAT", default=15, cast=int)
+EVENTS_RETRY_MAX = config("EVENTS_RETRY_MAX", default=30, cast=float)
+
+PRICE_TABLE_SIZE = config("PRICE_TABLE_SIZE", default=100000, cast=int)
+
+PASSWORD_HASH_ROUNDS = config("PASSWORD_HASH_ROUNDS", default=12, cast=int)
+PASSWORD_HASH_WORKERS = config("PASSWORD_HASH_WORKERS", default=2, cast=int)
+PASSWORD_HASH_MAX_PENDING = config("PASSWORD_HASH_MAX_PENDING", default=64, cast=int)
+
+TOKEN_CACHE_ENABLED = config("TOKEN_CACHE_ENABLED", default=True, cast=bool)
+TOKEN_CACHE_SIZE = config("TOKEN_CACHE_SIZE", default=50000, cast=int)
+TOKEN_REVOCATION_SIZE = config("TOKEN_REVOCATION_SIZE", default=100000, cast=int)
+
+# Rates are "<requests>/<seconds>", empty to turn a limit off.
+RATE_LIMIT_ENABLED = config("RATE_LIMIT_ENABLED", default=True, cast=bool)
+RATE_LIMIT_BUCKETS = config("RATE_LIMIT_BUCKETS", default=100000, cast=int)
+RATE_LIMIT_LOGIN_IP = config("RATE_LIMIT_LOGIN_IP", default="20/60")
+RATE_LIMIT_LOGIN_ACCOUNT = config("RATE_LIMIT_LOGIN_ACCOUNT", default="5/300")
+RATE_LIMIT_REGISTER_IP = config("RATE_LIMIT_REGISTER_IP", default="5/3600")
+RATE_LIMIT_AUTH_CONCURRENCY = config(
+    "RATE_LIMIT_AUTH_CONCURRENCY", default=16, cast=int
+)
+RATE_LIMIT_MAX_BODY = config("RATE_LIMIT_MAX_BODY", default=16384, cast=int)
@@ -4,9 +4,23 @@ from fastapi.staticfiles import StaticFiles
 import requests
 
 from app.accounts.routes import router as accounts_router
+from app.admin.routes import router as admin_router
+from app.analytics.routes import router as analytics_router
 from app.products.routes import router as products_router
 from app.orders.routes import router as orders_router
-from app.core.database import init_db
+from app.uploads.routes import router as uploads_router
+from app.core.database import get_database, init_db
+from app.core.passwords import password_hasher
+from app.core.ratelimit import (
+    RateLimitMiddleware,
+    RouteLimit,
+    parse_rate,
+    rate_limiter,
+)
+from app.orders.events import start_order_event_source
+from app.products.prices import price_table
+from app.products.services import warm_product_name_index
+from app.uploads.services import upload_pipeline
 from app.core import settings
 
 origins = ["http://localhost:5173", "http://127.0.0.1:5173"]
@@ -15,6 +29,27 @@ app.mount("/static", StaticFiles(directory="static"), name="static")
 app.include_router(accounts_router, prefix="/api/v1")
 app.include_router(products_router, prefix="/api/v1")
 app.include_router(orders_router, prefix="/api/v1")
+app.include_router(admin_router, prefix="/api/v1")
+app.include_router(uploads_router, prefix="/api/v1")
+app.include_router(analytics_router, prefix="/api/v1")
+rate_limiter.register(
+    "POST",
+    "/api/v1/auth/users/login",
+    RouteLimit(
+        ip=parse_rate(settings.RATE_LIMIT_LOGIN_IP),
+        account=parse_rate(settings.RATE_LIMIT_LOGIN_ACCOUNT),
+        max_concurrent=settings.RATE_LIMIT_AUTH_CONCURRENCY,
+    ),
+)
+rate_limiter.register(
+    "POST",
+    "/api/v1/auth/users/register",
+    RouteLimit(
+        ip=parse_rate(settings.RATE_LIMIT_REGISTER_IP),
+        max_concurrent=settings.RATE_LIMIT_AUTH_CONCURRENCY,
+    ),
+)
+app.add_middleware(RateLimitMiddleware, limiter=rate_limiter)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
@@ -27,6 +62,15 @@ app.add_middleware(
 @app.on_event("startup")
 async def startup_event():
     await init_db()
+    await warm_product_name_index(get_database())
+    await price_table.warm(get_database())
+    await upload_pipeline.cleanup_stale(get_database())
+    app.state.order_events_task = start_order_event_source(get_database())
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    password_hasher.shutdown()
 
 
 @app.get("/send-email")
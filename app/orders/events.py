@@ -0,0 +1,130 @@
+import asyncio
+import json
+import logging
+from datetime import datetime
+
+from pymongo.errors import OperationFailure
+
+from app.core import settings
+from app.core.events import EventBroker
+from app.orders.visibility import seller_view
+
+logger = logging.getLogger(__name__)
+
+ALL_ORDERS = "orders:all"
+
+order_broker = EventBroker(maxsize=settings.EVENTS_QUEUE_SIZE)
+
+
+def order_event(type: str, order) -> dict:
+    return {
+        "type": type,
+        "order_id": str(order["_id"]),
+        "buyer_id": str(order.get("buyer_id")),
+        "status": order.get("status"),
+        "total_price": order.get("total_price"),
+        "updated_at": order.get("updated_at"),
+    }
+
+
+def publish_order_event(type: str, order):
+    """
+    Publish from the request that changed the order. With the change stream
+    source the event comes back through `tail_order_changes` instead, from
+    whichever worker made the change.
+    """
+    if settings.ORDER_EVENTS_SOURCE == "local":
+        broadcast_order_event(type, order)
+
+
+def broadcast_order_event(type: str, order):
+    """
+    Admins and the buyer get the whole order, every seller only their part
+    of it (see `seller_view`).
+    """
+    order_broker.publish(
+        {ALL_ORDERS, str(order.get("buyer_id"))}, order_event(type, order)
+    )
+    for seller_id in order.get("seller_ids", []):
+        order_broker.publish(
+            {seller_id}, order_event(type, seller_view(order, seller_id))
+        )
+
+
+def format_sse(event: dict) -> str:
+    data = json.dumps(event, default=lambda value: value.isoformat())
+    return f"event: {event['type']}\ndata: {data}\n\n"
+
+
+async def stream_order_events(channels):
+    with order_broker.subscribe(channels) as subscription:
+        while True:
+            try:
+                event = await subscription.get(settings.EVENTS_HEARTBEAT)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+            if event is None:
+                yield "event: dropped\ndata: {}\n\n"
+                return
+            yield format_sse(event)
+
+
+CHANGE_TYPES = {
+    "insert": "order.created",
+    "update": "order.updated",
+    "replace": "order.updated",
+    "delete": "order.deleted",
+}
+
+# The resume token is gone from the oplog, or can no longer be resumed from.
+CHANGE_STREAM_LOST = {280, 286}
+
+
+def broadcast_change(change: dict):
+    order = (
+        change.get("fullDocument")
+        or change.get("fullDocumentBeforeChange")
+        or {"_id": change["documentKey"]["_id"], "updated_at": datetime.now()}
+    )
+    broadcast_order_event(CHANGE_TYPES[change["operationType"]], order)
+
+
+async def tail_order_changes(db):
+    """
+    Change stream source, needs a replica set. Feeds every order change into
+    the local broker so each worker pushes to its own subscribers. When the
+    stream fails, e.g. on an election or a dropped connection, it is opened
+    again after a growing delay and resumes after the last change seen.
+    """
+    pipeline = [{"$match": {"operationType": {"$in": list(CHANGE_TYPES)}}}]
+    resume_after, delay = None, 1.0
+    while True:
+        try:
+            async with db["orders"].watch(
+                pipeline,
+                full_document="updateLookup",
+                full_document_before_change="whenAvailable",
+                resume_after=resume_after,
+            ) as stream:
+                async for change in stream:
+                    try:
+                        broadcast_change(change)
+                    except Exception:
+                        logger.exception("Could not broadcast order change")
+                    resume_after, delay = stream.resume_token, 1.0
+            # The stream was invalidated, there is nothing to resume.
+            resume_after = None
+        except OperationFailure as e:
+            if e.code in CHANGE_STREAM_LOST:
+                resume_after = None
+            logger.exception("Order change stream failed, retrying in %ss", delay)
+        except Exception:
+            logger.exception("Order change stream failed, retrying in %ss", delay)
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, settings.EVENTS_RETRY_MAX)
+
+
+def start_order_event_source(db):
+    if settings.ORDER_EVENTS_SOURCE == "change_stream":
+        return asyncio.create_task(tail_order_changes(db))
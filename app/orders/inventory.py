@@ -0,0 +1,161 @@
+from collections import Counter
+
+from bson import ObjectId
+from fastapi import HTTPException
+from pymongo import UpdateOne
+
+from app.core._id import PyObjectId
+from app.orders.schemas import OrderStatus
+from app.products.prices import price_table
+from app.products.services import product_cache
+
+# Orders in these states hold stock; completed orders have consumed it.
+RESERVING_STATUSES = (OrderStatus.PENDING, OrderStatus.CONFIRMED)
+
+# Products keep the tokens of their latest reservations, see reserve_stock.
+RESERVATION_TOKENS = 100
+
+
+def count_quantities(items) -> Counter:
+    quantities = Counter()
+    for item in items:
+        quantities[item["product_id"]] += item["quantity"]
+    return quantities
+
+
+def _invalidate_products(ids):
+    # Product reads are cached with their stock_quantity.
+    for id in ids:
+        product_cache.invalidate(str(id))
+
+
+def priced_versions(items) -> dict:
+    """
+    The product version every priced order line was built from.
+    """
+    return {item["product_id"]: item.get("product_version") for item in items}
+
+
+def _reserve_filter(id, qty, versions):
+    query = {"_id": PyObjectId(id), "stock_quantity": {"$gte": qty}}
+    if versions is not None and id in versions:
+        query["version"] = versions[id]
+    return query
+
+
+async def reserve_stock(db, order_id, quantities: Counter, session=None, versions=None):
+    """
+    Take stock for every line of an order in one unordered bulk_write of
+    conditional $inc updates. Each update also pushes a token of this
+    reservation onto the product so that, if any line is short, exactly the
+    lines that were taken can be put back. The token list is capped at
+    RESERVATION_TOKENS, so a successful reservation needs no cleanup; a token
+    only has to survive the two round trips of the failure path. Raises 409
+    with the products that are out of stock.
+
+    When `versions` is given, every update also has to match the product
+    version the order was priced at, so a price change made since is caught
+    here; products whose quantity does not change are still checked.
+    """
+    quantities = {id: qty for id, qty in quantities.items() if qty > 0}
+    for id in versions or {}:
+        quantities.setdefault(id, 0)
+    if not quantities:
+        return
+
+    token = ObjectId()
+    push = {"$each": [token], "$slice": -RESERVATION_TOKENS}
+    operations = [
+        UpdateOne(
+            _reserve_filter(id, qty, versions),
+            {
+                "$inc": {"stock_quantity": -qty},
+                "$push": {"reservation_tokens": push},
+            },
+        )
+        for id, qty in quantities.items()
+    ]
+    result = await db["products"].bulk_write(operations, ordered=False, session=session)
+    ids = [PyObjectId(id) for id in quantities]
+    _invalidate_products(quantities)
+
+    if result.matched_count < len(operations):
+        cursor = db["products"].find(
+            {"_id": {"$in": ids}, "reservation_tokens": {"$ne": token}},
+            {"version": 1},
+            session=session,
+        )
+        failed = [product async for product in cursor]
+        await db["products"].bulk_write(
+            [
+                UpdateOne(
+                    {"_id": PyObjectId(id), "reservation_tokens": token},
+                    {
+                        "$inc": {"stock_quantity": qty},
+                        "$pull": {"reservation_tokens": token},
+                    },
+                )
+                for id, qty in quantities.items()
+            ],
+            ordered=False,
+            session=session,
+        )
+        _invalidate_products(quantities)
+
+        stale = [
+            str(product["_id"])
+            for product in failed
+            if versions is not None
+            and str(product["_id"]) in versions
+            and product.get("version") != versions[str(product["_id"])]
+        ]
+        if stale:
+            for id in stale:
+                price_table.invalidate(id)
+            raise HTTPException(
+                status_code=409,
+                detail={
+                    "message": "Product prices changed, review the order.",
+                    "product_ids": stale,
+                },
+            )
+        raise HTTPException(
+            status_code=409,
+            detail={
+                "message": "Insufficient stock.",
+                "product_ids": [str(product["_id"]) for product in failed],
+            },
+        )
+
+
+async def release_stock(db, quantities: Counter, session=None):
+    operations = [
+        UpdateOne({"_id": PyObjectId(id)}, {"$inc": {"stock_quantity": qty}})
+        for id, qty in quantities.items()
+        if qty > 0
+    ]
+    if operations:
+        await db["products"].bulk_write(operations, ordered=False, session=session)
+        _invalidate_products(id for id, qty in quantities.items() if qty > 0)
+
+
+async def adjust_stock(db, order_id, old_items, new_items, session=None):
+    """
+    Move stock by the difference between two versions of an order: lines
+    that grew are reserved, lines that shrank or disappeared are released.
+    Every product of the new version is checked against the price it was
+    given.
+    """
+    delta = Counter(count_quantities(new_items))
+    delta.subtract(count_quantities(old_items))
+
+    await reserve_stock(
+        db,
+        order_id,
+        Counter({id: qty for id, qty in delta.items() if qty > 0}),
+        session,
+        versions=priced_versions(new_items),
+    )
+    await release_stock(
+        db, Counter({id: -qty for id, qty in delta.items() if qty < 0}), session
+    )
@@ -1,43 +1,113 @@
 from datetime import datetime
 from typing import List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, status
+from fastapi.responses import StreamingResponse
 from motor.motor_asyncio import AsyncIOMotorDatabase
 
 from app.accounts.permissions import (
     hasAdminPermission,
+    hasDispatcherPermission,
     hasOwnerPermission,
     hasRetailerPermission,
+    hasWholeSalerPermission,
 )
-from app.accounts.services import get_current_user
 from app.core._id import PyObjectId
 from app.core.auth import AuthHandler
 from app.core.database import get_database
-from app.core.helpers import transform_mongo_data
-from app.core.pagination import paginate
-from app.orders.schemas import OrderCreateSchema, OrderItemDetail, OrderUpdateSchema
-from app.orders.services import order_create_job, order_update_job
+from app.core.export import ExportFormat, export_response
+from app.core.idempotency import idempotent
+from app.core.helpers import json_response, transform_mongo_data
+from app.core.pagination import CURSOR_HELP, paginate_aggregate, paginate_cursor
+from app.orders.events import ALL_ORDERS, stream_order_events
+from app.orders.schemas import (
+    OrderCreateSchema,
+    OrderItemDetail,
+    OrderStatus,
+    OrderStatusUpdate,
+    OrderUpdateSchema,
+)
+from app.orders.services import (
+    ORDER_EXPORT_FIELDS,
+    ORDER_SERIALIZER,
+    BULK_MAX_ORDERS,
+    build_orders_query,
+    bulk_transition_orders,
+    order_create_job,
+    order_delete_job,
+    order_list_projection,
+    order_update_job,
+)
+from app.orders.visibility import seller_view, seller_view_stages
 
 ERROR_CODE = status.HTTP_404_NOT_FOUND
 auth_handler = AuthHandler()
 router = APIRouter(prefix="/orders", tags=["Orders"])
 
 
+@router.get("/export")
+async def export_orders(
+    format: ExportFormat = ExportFormat.NDJSON,
+    status: Optional[OrderStatus] = None,
+    req_user=Depends(auth_handler.user_wrapper),
+    db: AsyncIOMotorDatabase = Depends(get_database),
+):
+    if not hasOwnerPermission(req_user):
+        raise HTTPException(status_code=403, detail="Not allowed.")
+
+    query = build_orders_query(req_user, status)
+    pipeline = [{"$match": query}, {"$sort": {"_id": 1}}]
+    if hasWholeSalerPermission(req_user):
+        pipeline.extend(seller_view_stages(str(req_user["_id"])))
+    cursor = db["orders"].aggregate(pipeline)
+    return export_response(cursor, format, "orders", ORDER_EXPORT_FIELDS)
+
+
+@router.get("/events")
+async def order_events(
+    req_user=Depends(auth_handler.user_wrapper),
+    db: AsyncIOMotorDatabase = Depends(get_database),
+):
+    """
+    Server-Sent Events feed of order changes: your own orders, as buyer or
+    seller, or every order for admins and dispatchers.
+    """
+    if hasAdminPermission(req_user) or hasDispatcherPermission(req_user):
+        channels = [ALL_ORDERS]
+    elif hasOwnerPermission(req_user):
+        channels = [str(req_user["_id"])]
+    else:
+        raise HTTPException(status_code=403, detail="Not allowed.")
+
+    return StreamingResponse(
+        stream_order_events(channels),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @router.get("/{id}")
 async def get_orders_by_id(
     id: str,
-    current_user=Depends(auth_handler.auth_wrapper),
+    req_user=Depends(auth_handler.user_wrapper),
     db: AsyncIOMotorDatabase = Depends(get_database),
 ):
-    req_user = await get_current_user(current_user, db)
     if not (hasOwnerPermission(req_user)):
         msg = "Not allowed, contact Administrator"
         raise HTTPException(status_code=403, detail=msg)
 
     order = await db["orders"].find_one({"_id": PyObjectId(id)})
+    if not order:
+        raise HTTPException(status_code=404, detail="Order not found.")
     if hasRetailerPermission(req_user) and not req_user["_id"] == order["buyer_id"]:
         msg = "Not allowed, contact Administrator"
         raise HTTPException(status_code=403, detail=msg)
+    if hasWholeSalerPermission(req_user):
+        seller_id = str(req_user["_id"])
+        if seller_id not in order.get("seller_ids", []):
+            msg = "Not allowed, contact Administrator"
+            raise HTTPException(status_code=403, detail=msg)
+        order = seller_view(order, seller_id)
 
     order = transform_mongo_data(order)
     return order
@@ -45,57 +115,75 @@ async def get_orders_by_id(
 
 @router.get("/")
 async def get_my_orders(
-    status: Optional[str] = None,
+    status: Optional[OrderStatus] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    buyer_id: Optional[str] = Query(None, description="Admins only"),
+    include_items: bool = True,
     page: int = Query(1, ge=1),
     page_size: int = Query(10, ge=1, le=100),
-    current_user=Depends(auth_handler.auth_wrapper),
+    cursor: Optional[str] = Query(None, description=CURSOR_HELP),
+    req_user=Depends(auth_handler.user_wrapper),
     db: AsyncIOMotorDatabase = Depends(get_database),
 ):
-    req_user = await get_current_user(current_user, db)
     if not hasOwnerPermission(req_user):
         raise HTTPException(status_code=403, detail="Not allowed.")
 
-    if hasAdminPermission(req_user):
-        orders = (
-            await db["orders"].find({"status": status}).to_list(length=None)
-            if status
-            else await db["orders"].find().to_list(length=None)
+    query = build_orders_query(req_user, status, created_from, created_to, buyer_id)
+    page_stages = [{"$project": order_list_projection(include_items)}]
+    if hasWholeSalerPermission(req_user):
+        page_stages = seller_view_stages(str(req_user["_id"])) + page_stages
+
+    if cursor is not None:
+        paginated_response = await paginate_cursor(
+            db["orders"],
+            query,
+            cursor=cursor,
+            page_size=page_size,
+            sort_key="created_at",
+            direction=-1,
+            page_stages=page_stages,
         )
-        return orders
-
-    query = {"$or": [{"buyer_id": req_user["_id"]}, {"seller_id": req_user["_id"]}]}
-    if status:
-        query["status"] = status
-
-    orders = await db["orders"].find(query).to_list(length=None)
-    paginated_response = paginate(
-        transform_mongo_data(orders), page=page, page_size=page_size
-    )
-    return paginated_response
+    else:
+        paginated_response = await paginate_aggregate(
+            db["orders"],
+            [{"$match": query}, {"$sort": {"created_at": -1, "_id": -1}}],
+            page=page,
+            page_size=page_size,
+            page_stages=page_stages,
+        )
+    paginated_response["items"] = ORDER_SERIALIZER.many(paginated_response["items"])
+    return json_response(paginated_response)
 
 
 @router.post("/", response_model=List[OrderItemDetail])
 async def create_order(
     payload: OrderCreateSchema,
-    current_user=Depends(auth_handler.auth_wrapper),
+    idempotency_key: Optional[str] = Header(None, max_length=255),
+    req_user=Depends(auth_handler.user_wrapper),
     db: AsyncIOMotorDatabase = Depends(get_database),
 ):
-    req_user = await get_current_user(current_user, db)
     if not hasRetailerPermission(req_user):
         msg = "Not allowed, contact Administrator"
         raise HTTPException(status_code=403, detail=msg)
 
-    order_item_list = await order_create_job(req_user, payload, db)
+    order_item_list = await idempotent(
+        db,
+        idempotency_key,
+        f"{req_user['_id']}:create_order",
+        payload,
+        lambda: order_create_job(req_user, payload, db),
+    )
     return order_item_list
 
 
 @router.patch("")
 async def update_order(
     payload: OrderUpdateSchema,
-    current_user=Depends(auth_handler.auth_wrapper),
+    idempotency_key: Optional[str] = Header(None, max_length=255),
+    req_user=Depends(auth_handler.user_wrapper),
     db: AsyncIOMotorDatabase = Depends(get_database),
 ):
-    req_user = await get_current_user(current_user, db)
     if not hasRetailerPermission(req_user):
         msg = "Not allowed, contact Administrator"
         raise HTTPException(status_code=403, detail=msg)
@@ -114,30 +202,45 @@ async def update_order(
         msg = "Not allowed, contact Administrator"
         raise HTTPException(status_code=403, detail=msg)
 
-    order_list = []
-    order_item_list = await order_update_job(order, order_list, order["items"], db)
-    await db["orders"].update_one(
-        {"_id": PyObjectId(order["id"])},
-        {
-            "$set": {
-                "items": order_item_list,
-                "updated_at": datetime.now(),
-                "total_price": sum([item["subtotal"] for item in order_item_list]),
-            }
-        },
+    async def update():
+        await order_update_job(existing_order, order["items"], db)
+        return {"details": "Order Updated successfully"}
+
+    return await idempotent(
+        db, idempotency_key, f"{req_user['_id']}:update_order", payload, update
     )
-    return {"details": "Order Updated successfully"}
+
+
+@router.patch("/status")
+async def update_order_statuses(
+    updates: List[OrderStatusUpdate],
+    req_user=Depends(auth_handler.user_wrapper),
+    db: AsyncIOMotorDatabase = Depends(get_database),
+):
+    if not (hasAdminPermission(req_user) or hasDispatcherPermission(req_user)):
+        msg = "Only admins or dispatchers can perform this action."
+        raise HTTPException(status_code=403, detail=msg)
+
+    if len(updates) > BULK_MAX_ORDERS:
+        msg = f"At most {BULK_MAX_ORDERS} orders can be sent at once."
+        raise HTTPException(status_code=400, detail=msg)
+
+    results = await bulk_transition_orders(db, updates)
+    return {
+        "updated": sum(1 for result in results if result["result"] == "updated"),
+        "errors": sum(1 for result in results if result["result"] == "error"),
+        "results": results,
+    }
 
 
 @router.delete("/{id}")
 async def delete_order(
     id: str,
-    current_user=Depends(auth_handler.auth_wrapper),
+    req_user=Depends(auth_handler.user_wrapper),
     db: AsyncIOMotorDatabase = Depends(get_database),
 ):
-    req_user = await get_current_user(current_user, db)
     if not (hasAdminPermission(req_user) or hasRetailerPermission(req_user)):
         msg = "Not allowed, contact Administrator"
         raise HTTPException(status_code=403, detail=msg)
 
-    await db["orders"].delete_one({"_id": PyObjectId(id)})
+    await order_delete_job(id, db)
@@ -46,3 +46,8 @@ class OrderCreateSchema(BaseModel):
 class OrderUpdateSchema(BaseModel):
     id: str
     items: List[OrderItem]
+
+
+class OrderStatusUpdate(BaseModel):
+    id: str
+    status: OrderStatus
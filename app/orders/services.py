@@ -1,35 +1,188 @@
 from datetime import datetime
 
+from bson import ObjectId
 from fastapi import HTTPException
+from pymongo import IndexModel, UpdateOne
 
+from app.accounts.permissions import hasAdminPermission, hasWholeSalerPermission
+from app.analytics.services import rollup_operations, update_rollups, with_sellers
 from app.core._id import PyObjectId
+from app.core.database import run_in_transaction
+from app.core.helpers import MongoSerializer
+from app.orders.events import publish_order_event
+from app.orders.inventory import (
+    RESERVING_STATUSES,
+    adjust_stock,
+    count_quantities,
+    priced_versions,
+    release_stock,
+    reserve_stock,
+)
+from app.core.indexes import register_indexes, register_query
 from app.orders.schemas import OrderStatus
+from app.products.prices import price_table
 
+register_indexes(
+    "orders",
+    [
+        IndexModel([("created_at", -1), ("_id", -1)], name="created_at"),
+        IndexModel(
+            [("status", 1), ("created_at", -1), ("_id", -1)], name="status_created_at"
+        ),
+        IndexModel(
+            [("buyer_id", 1), ("created_at", -1), ("_id", -1)], name="buyer_created_at"
+        ),
+        IndexModel(
+            [("buyer_id", 1), ("status", 1), ("created_at", -1), ("_id", -1)],
+            name="buyer_status_created_at",
+        ),
+        IndexModel(
+            [("seller_ids", 1), ("created_at", -1), ("_id", -1)],
+            name="seller_ids_created_at",
+        ),
+        IndexModel(
+            [("seller_ids", 1), ("status", 1), ("created_at", -1), ("_id", -1)],
+            name="seller_ids_status_created_at",
+        ),
+    ],
+)
+register_query(
+    "buyer_orders",
+    "orders",
+    {"buyer_id": ObjectId(), "status": "pending"},
+    sort=[("created_at", -1), ("_id", -1)],
+)
+register_query(
+    "seller_orders",
+    "orders",
+    {"seller_ids": str(ObjectId()), "status": "pending"},
+    sort=[("created_at", -1), ("_id", -1)],
+)
 
-async def initiate_order(req_user, payload, db):
-    order_data = {
+register_query(
+    "admin_orders",
+    "orders",
+    {"status": "pending", "created_at": {"$gte": datetime(2024, 1, 1)}},
+    sort=[("created_at", -1), ("_id", -1)],
+)
+
+ORDER_LIST_FIELDS = [
+    "buyer_id",
+    "seller_ids",
+    "status",
+    "total_price",
+    "created_at",
+    "updated_at",
+]
+
+ORDER_SERIALIZER = MongoSerializer(object_ids=("buyer_id",))
+
+ORDER_TRANSITIONS = {
+    OrderStatus.PENDING: {OrderStatus.CONFIRMED, OrderStatus.CANCELLED},
+    OrderStatus.CONFIRMED: {OrderStatus.COMPLETED, OrderStatus.CANCELLED},
+    OrderStatus.COMPLETED: set(),
+    OrderStatus.CANCELLED: set(),
+}
+
+BULK_MAX_ORDERS = 1000
+
+ORDER_EXPORT_FIELDS = [
+    "id",
+    "buyer_id",
+    "seller_ids",
+    "status",
+    "total_price",
+    "created_at",
+    "updated_at",
+]
+
+
+def build_orders_query(
+    req_user, status=None, created_from=None, created_to=None, buyer_id=None
+) -> dict:
+    """
+    Orders visible to the user: admins see every order and may filter by
+    buyer, wholesalers see the orders holding their products and everyone
+    else the orders they placed. Each case is a single indexed range scan.
+    """
+    if buyer_id and not ObjectId.is_valid(buyer_id):
+        raise HTTPException(status_code=400, detail="Invalid buyer_id.")
+
+    if hasAdminPermission(req_user):
+        query = {"buyer_id": PyObjectId(buyer_id)} if buyer_id else {}
+    elif hasWholeSalerPermission(req_user):
+        query = {"seller_ids": str(req_user["_id"])}
+    else:
+        query = {"buyer_id": req_user["_id"]}
+
+    if status:
+        query["status"] = status
+    if created_from or created_to:
+        query["created_at"] = {}
+        if created_from:
+            query["created_at"]["$gte"] = created_from
+        if created_to:
+            query["created_at"]["$lte"] = created_to
+    return query
+
+
+def order_list_projection(include_items: bool = True) -> dict:
+    projection = {field: 1 for field in ORDER_LIST_FIELDS}
+    if include_items:
+        projection["items"] = 1
+    return projection
+
+
+def get_seller_ids(order_item_list) -> list:
+    return sorted(
+        {str(item["seller_id"]) for item in order_item_list if item.get("seller_id")}
+    )
+
+
+def build_order(req_user, order_id, order_item_list):
+    now = datetime.now()
+    return {
+        "_id": order_id,
         "buyer_id": req_user["_id"],
-        "items": [],
-        "created_at": datetime.now(),
-        "updated_at": datetime.now(),
+        "seller_ids": get_seller_ids(order_item_list),
+        "items": order_item_list,
+        "created_at": now,
+        "updated_at": now,
         "status": OrderStatus.PENDING,
-        "total_price": 0.0,
+        "total_price": sum([item["subtotal"] for item in order_item_list]),
     }
-    order = await db["orders"].insert_one(order_data)
-    return order
 
 
 async def build_order_item_list(order_id, order_item_list, order_items, db):
+    """
+    Price the lines of an order from the in-memory price table; only products
+    it does not hold yet are read. Every line records the product version it
+    was priced at, which `reserve_stock` checks when the order is written.
+    """
+    products = await price_table.get_many(
+        db, {item["product_id"] for item in order_items}
+    )
+    missing = [
+        item["product_id"] for item in order_items if item["product_id"] not in products
+    ]
+    if missing:
+        raise HTTPException(
+            status_code=400,
+            detail={"message": "Products not found.", "product_ids": missing},
+        )
+
     for item in order_items:
-        product = await db["products"].find_one({"_id": PyObjectId(item["product_id"])})
+        product = products[item["product_id"]]
         item_info = {
             "order_id": str(order_id),
             "product_id": item["product_id"],
-            "product_name": product["name"],
-            "product_description": product["description"],
-            "price": float(product["price_per_unit"]),
+            "product_version": product.version,
+            "seller_id": product.seller_id,
+            "product_name": product.name,
+            "product_description": product.description,
+            "price": product.price,
             "quantity": item["quantity"],
-            "subtotal": float(product["price_per_unit"]) * item["quantity"],
+            "subtotal": product.price * item["quantity"],
         }
         order_item_list.append(item_info)
     return order_item_list
@@ -38,30 +191,208 @@ async def build_order_item_list(order_id, order_item_list, order_items, db):
 async def order_create_job(req_user, payload: dict, db) -> list:
     try:
         order_items = payload.dict()["items"]
-        order_item_list = []
-        order = await initiate_order(req_user, payload, db)
-        order_id = order.inserted_id
-        order_item_list = await build_order_item_list(
-            order_id, order_item_list, order_items, db
-        )
+        order_id = ObjectId()
+        order_item_list = await build_order_item_list(order_id, [], order_items, db)
+        order = build_order(req_user, order_id, order_item_list)
 
-        await db["orders"].update_one(
-            {"_id": PyObjectId(order.inserted_id)},
-            {
-                "$push": {"items": {"$each": [item for item in order_item_list]}},
-                "$set": {
-                    "updated_at": datetime.now(),
-                    "total_price": sum([item["subtotal"] for item in order_item_list]),
-                },
-            },
-        )
+        async def write_order(session):
+            await reserve_stock(
+                db,
+                order_id,
+                count_quantities(order_items),
+                session,
+                versions=priced_versions(order_item_list),
+            )
+            try:
+                await db["orders"].insert_one(order, session=session)
+            except Exception:
+                await release_stock(db, count_quantities(order_items), session)
+                raise
+            await update_rollups(db, order, order_item_list, session=session)
+
+        await run_in_transaction(write_order)
+        publish_order_event("order.created", order)
         return order_item_list
+    except HTTPException:
+        raise
     except Exception as e:
-        raise HTTPException(f"Something went wrong: {e}")
+        raise HTTPException(status_code=500, detail=f"Something went wrong: {e}")
 
 
-async def order_update_job(order, order_list, order_items, db):
-    order_item_list = await build_order_item_list(
-        order["id"], order_list, order_items, db
-    )
+async def order_update_job(existing_order, order_items, db):
+    order_id = existing_order["_id"]
+    order_item_list = await build_order_item_list(order_id, [], order_items, db)
+
+    now = datetime.now()
+    changes = {
+        "items": order_item_list,
+        "seller_ids": get_seller_ids(order_item_list),
+        # Mongo keeps milliseconds, the value is matched on again below.
+        "updated_at": now.replace(microsecond=now.microsecond // 1000 * 1000),
+        "total_price": sum([item["subtotal"] for item in order_item_list]),
+    }
+
+    async def write_order(session):
+        # The stock delta is computed from `existing_order`, so the write only
+        # goes through if the order is still the one that was read.
+        result = await db["orders"].update_one(
+            {"_id": order_id, "updated_at": existing_order.get("updated_at")},
+            {"$set": changes},
+            session=session,
+        )
+        if not result.matched_count:
+            msg = "Order was changed by another request, reload it and retry."
+            raise HTTPException(status_code=409, detail=msg)
+
+        if existing_order["status"] in RESERVING_STATUSES:
+            try:
+                await adjust_stock(
+                    db, order_id, existing_order["items"], order_item_list, session
+                )
+            except Exception:
+                await db["orders"].update_one(
+                    {"_id": order_id, "updated_at": changes["updated_at"]},
+                    {"$set": {field: existing_order.get(field) for field in changes}},
+                    session=session,
+                )
+                raise
+        await update_rollups(db, existing_order, existing_order["items"], -1, session)
+        await update_rollups(db, existing_order, order_item_list, session=session)
+
+    await run_in_transaction(write_order)
+    publish_order_event("order.updated", {**existing_order, **changes})
     return order_item_list
+
+
+async def order_delete_job(order_id, db):
+    async def delete_order(session):
+        order = await db["orders"].find_one_and_delete(
+            {"_id": PyObjectId(order_id)}, session=session
+        )
+        if order and order["status"] in RESERVING_STATUSES:
+            await release_stock(db, count_quantities(order["items"]), session)
+        if order:
+            await update_rollups(db, order, order["items"], -1, session)
+        return order
+
+    order = await run_in_transaction(delete_order)
+    if order:
+        publish_order_event("order.deleted", order)
+    return order
+
+
+async def bulk_transition_orders(db, updates) -> list:
+    """
+    Move a batch of orders to new statuses with one bulk_write. Every update
+    is checked against ORDER_TRANSITIONS and only applies if the order is
+    still the one that was read (same status and updated_at); cancelling
+    gives the stock back and takes the order out of the sales rollups.
+    Returns one result per update.
+    """
+    results = [{"id": update.id, "status": update.status} for update in updates]
+    valid_ids = {
+        PyObjectId(update.id) for update in updates if ObjectId.is_valid(update.id)
+    }
+    cursor = db["orders"].find({"_id": {"$in": list(valid_ids)}})
+    orders = {str(order["_id"]): order async for order in cursor}
+
+    batch = ObjectId()
+    operations, applied, seen = [], [], set()
+    now = datetime.now()
+    now = now.replace(microsecond=now.microsecond // 1000 * 1000)
+    for result, update in zip(results, updates):
+        order = orders.get(update.id)
+        if update.id in seen:
+            result.update(result="error", detail="Duplicate order in request.")
+            continue
+        seen.add(update.id)
+
+        if order is None:
+            result.update(result="error", detail="Order does not exist.")
+            continue
+        current = OrderStatus(order["status"])
+        if update.status not in ORDER_TRANSITIONS[current]:
+            detail = f"Cannot move order from {current.value} to {update.status.value}."
+            result.update(result="error", detail=detail)
+            continue
+
+        operations.append(
+            UpdateOne(
+                # Stock and rollups are released from the items read here.
+                {
+                    "_id": order["_id"],
+                    "status": order["status"],
+                    "updated_at": order.get("updated_at"),
+                },
+                {
+                    "$set": {
+                        "status": update.status,
+                        "updated_at": now,
+                        "status_batch": batch,
+                    }
+                },
+            )
+        )
+        applied.append((result, order, update.status))
+
+    async def write_transitions(session):
+        if not operations:
+            return applied
+        ids = [order["_id"] for _, order, _ in applied]
+        write = await db["orders"].bulk_write(
+            operations, ordered=False, session=session
+        )
+        changed = applied
+        if write.matched_count < len(operations):
+            # Some orders moved since they were read, the batch marker tells
+            # which updates are ours.
+            cursor = db["orders"].find(
+                {"_id": {"$in": ids}, "status_batch": batch},
+                {"_id": 1},
+                session=session,
+            )
+            ours = {order["_id"] async for order in cursor}
+            changed = [entry for entry in applied if entry[1]["_id"] in ours]
+        await db["orders"].update_many(
+            {"_id": {"$in": ids}, "status_batch": batch},
+            {"$unset": {"status_batch": ""}},
+            session=session,
+        )
+
+        cancelled = [
+            order for _, order, status in changed if status == OrderStatus.CANCELLED
+        ]
+        released = count_quantities(
+            item
+            for order in cancelled
+            if order["status"] in RESERVING_STATUSES
+            for item in order["items"]
+        )
+        await release_stock(db, released, session)
+        items = await with_sellers(
+            db, [item for order in cancelled for item in order["items"]], session
+        )
+        rollups, start = [], 0
+        for order in cancelled:
+            end = start + len(order["items"])
+            rollups.extend(rollup_operations(order, items[start:end], -1))
+            start = end
+        if rollups:
+            await db["sales_rollups"].bulk_write(
+                rollups, ordered=False, session=session
+            )
+        return changed
+
+    changed = await run_in_transaction(write_transitions)
+    changed_ids = {order["_id"] for _, order, _ in changed}
+    for result, order, status in applied:
+        if order["_id"] not in changed_ids:
+            result.update(
+                result="error", detail="Order was changed by another request."
+            )
+            continue
+        result["result"] = "updated"
+        publish_order_event(
+            "order.updated", {**order, "status": status, "updated_at": now}
+        )
+    return results
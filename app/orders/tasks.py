@@ -0,0 +1,60 @@
+import asyncio
+
+from app.core.database import get_database
+
+
+async def backfill_seller_ids(db):
+    """
+    Set `seller_ids` on orders created before it existed, looking up the
+    seller of every line's product. Runs inside MongoDB with a $merge.
+    """
+    pipeline = [
+        {"$match": {"seller_ids": {"$exists": False}}},
+        {
+            "$lookup": {
+                "from": "products",
+                "let": {
+                    "product_ids": {
+                        "$map": {
+                            "input": "$items.product_id",
+                            "in": {"$toObjectId": "$$this"},
+                        }
+                    }
+                },
+                "pipeline": [
+                    {"$match": {"$expr": {"$in": ["$_id", "$$product_ids"]}}},
+                    {"$project": {"seller_id": {"$toString": "$seller_id"}}},
+                ],
+                "as": "products",
+            }
+        },
+        {
+            "$project": {
+                "seller_ids": {
+                    "$setUnion": [
+                        {
+                            "$filter": {
+                                "input": "$products.seller_id",
+                                "cond": {"$ne": ["$$this", None]},
+                            }
+                        }
+                    ]
+                }
+            }
+        },
+        {
+            "$merge": {
+                "into": "orders",
+                "on": "_id",
+                "whenMatched": "merge",
+                "whenNotMatched": "discard",
+            }
+        },
+    ]
+    await db["orders"].aggregate(pipeline).to_list(length=None)
+
+
+if __name__ == "__main__":
+    # python -m app.orders.tasks
+    asyncio.run(backfill_seller_ids(get_database()))
+    print("Order seller_ids backfilled")
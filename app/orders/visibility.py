@@ -0,0 +1,40 @@
+from typing import List
+
+
+def seller_view(order: dict, seller_id: str) -> dict:
+    """
+    The part of an order a seller may see: their own lines and the total of
+    those, never the other sellers' products or prices in the same basket.
+    """
+    items = [
+        item
+        for item in order.get("items", [])
+        if str(item.get("seller_id")) == seller_id
+    ]
+    return {
+        **order,
+        "items": items,
+        "seller_ids": [seller_id],
+        "total_price": sum(item["subtotal"] for item in items),
+    }
+
+
+def seller_view_stages(seller_id: str) -> List[dict]:
+    """
+    `seller_view` as aggregation stages, for lists and exports.
+    """
+    return [
+        {
+            "$set": {
+                "items": {
+                    "$filter": {
+                        "input": {"$ifNull": ["$items", []]},
+                        "as": "item",
+                        "cond": {"$eq": [{"$toString": "$$item.seller_id"}, seller_id]},
+                    }
+                },
+                "seller_ids": [seller_id],
+            }
+        },
+        {"$set": {"total_price": {"$sum": "$items.subtotal"}}},
+    ]
@@ -0,0 +1,96 @@
+from collections import OrderedDict
+from typing import Dict, Iterable, NamedTuple, Optional
+
+from bson import ObjectId
+
+from app.core import settings
+from app.core._id import PyObjectId
+
+SUMMARY_PROJECTION = {
+    "name": 1,
+    "description": 1,
+    "price_per_unit": 1,
+    "seller_id": 1,
+    "version": 1,
+}
+
+
+class ProductSummary(NamedTuple):
+    price: float
+    name: str
+    description: str
+    seller_id: Optional[str]
+    version: Optional[int]
+
+
+class PriceTable:
+    """
+    Compact product id -> (price, name, description, seller, version) map
+    used to price orders without reading the products collection. Entries
+    are dropped by update_product in this process; changes made elsewhere
+    are caught at write time, because stock reservation only matches the
+    product version the order was priced with.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, ProductSummary]" = OrderedDict()
+
+    def set(self, product):
+        self._entries[str(product["_id"])] = ProductSummary(
+            price=float(product["price_per_unit"]),
+            name=product["name"],
+            description=product["description"],
+            seller_id=product.get("seller_id"),
+            version=product.get("version"),
+        )
+        self._entries.move_to_end(str(product["_id"]))
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, id: str):
+        self._entries.pop(str(id), None)
+
+    async def warm(self, db):
+        cursor = db["products"].find({}, SUMMARY_PROJECTION).batch_size(1000)
+        async for product in cursor.limit(self.maxsize):
+            self.set(product)
+
+    async def get_many(self, db, ids: Iterable[str]) -> Dict[str, ProductSummary]:
+        """
+        Summaries for the given ids; only the misses are read, with one $in.
+        Unknown or invalid ids are left out.
+        """
+        found, missing = {}, set()
+        for id in ids:
+            summary = self._entries.get(id)
+            if summary is None:
+                missing.add(id)
+            else:
+                self._entries.move_to_end(id)
+                found[id] = summary
+        self.hits += len(found)
+        self.misses += len(missing)
+
+        object_ids = [PyObjectId(id) for id in missing if ObjectId.is_valid(id)]
+        if object_ids:
+            cursor = db["products"].find(
+                {"_id": {"$in": object_ids}}, SUMMARY_PROJECTION
+            )
+            async for product in cursor:
+                self.set(product)
+                found[str(product["_id"])] = self._entries[str(product["_id"])]
+        return found
+
+    def stats(self):
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+price_table = PriceTable(settings.PRICE_TABLE_SIZE)
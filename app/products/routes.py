@@ -1,45 +1,92 @@
-import uuid
-import shutil
-from datetime import datetime
-from typing import Optional
-
-import cloudinary
-import cloudinary.uploader
-from cloudinary.utils import cloudinary_url
+from typing import List, Optional
+
 from fastapi import APIRouter, Depends, File, HTTPException, Query, UploadFile, status
 from motor.motor_asyncio import AsyncIOMotorDatabase
-from pymongo import ReturnDocument
 
 from app.accounts.permissions import (
     hasAdminPermission,
     hasCreateProductPermission,
     hasWholeSalerPermission,
 )
-from app.accounts.services import get_current_user
 from app.products.schemas import (
     ProductCreateSchema,
     ProductDetailSchema,
-    ProductImageSchema,
     ProductCategory,
     ProductStatus,
 )
-from app.products.services import get_products_response
+from app.products.prices import price_table
+from app.products.services import (
+    BULK_MAX_PRODUCTS,
+    LIST_IMAGES_STAGE,
+    PRODUCT_SERIALIZER,
+    PRODUCT_EXPORT_FIELDS,
+    PRODUCT_CHANGED,
+    PRODUCT_PROJECTION,
+    build_products_query,
+    bulk_write_products,
+    get_cached_product,
+    get_products_response,
+    product_cache,
+    product_name_index,
+    product_update,
+    save_product_image,
+)
 from app.core.auth import AuthHandler
 from app.core._id import PyObjectId
 from app.core.database import get_database
-from app.core.helpers import transform_mongo_data
-from app.core.pagination import paginate
-from app.core import settings
+from app.core.export import ExportFormat, export_response
+from app.core.helpers import json_response, transform_mongo_data
+from app.core.pagination import CURSOR_HELP, paginate_aggregate, paginate_cursor
+from app.uploads.services import upload_pipeline
 
 ERROR_CODE = status.HTTP_404_NOT_FOUND
 auth_handler = AuthHandler()
 router = APIRouter(prefix="/products", tags=["Products"])
 
-cloudinary.config(
-    cloud_name=settings.CLOUD_NAME,
-    api_key=settings.CLOUDINARY_API_KEY,
-    api_secret=settings.CLOUDINARY_API_SECRET,
-)
+
+@router.get("/export")
+async def export_products(
+    format: ExportFormat = ExportFormat.NDJSON,
+    category: Optional[ProductCategory] = None,
+    status: Optional[ProductStatus] = None,
+    db: AsyncIOMotorDatabase = Depends(get_database),
+):
+    cursor = db["products"].find(build_products_query(category, status)).sort("_id")
+    return export_response(cursor, format, "products", PRODUCT_EXPORT_FIELDS)
+
+
+@router.get("/search")
+async def search_products(
+    q: str = Query(..., min_length=1),
+    category: Optional[ProductCategory] = None,
+    status: Optional[ProductStatus] = None,
+    page: int = Query(1, ge=1),
+    page_size: int = Query(10, ge=1, le=100),
+    db: AsyncIOMotorDatabase = Depends(get_database),
+):
+    query = {"$text": {"$search": q}, **build_products_query(category, status)}
+    pipeline = [
+        {"$match": query},
+        {"$sort": {"score": {"$meta": "textScore"}, "_id": 1}},
+        {"$addFields": {"score": {"$meta": "textScore"}}},
+    ]
+    paginated_response = await paginate_aggregate(
+        db["products"],
+        pipeline,
+        page=page,
+        page_size=page_size,
+        page_stages=[LIST_IMAGES_STAGE, {"$project": PRODUCT_PROJECTION}],
+    )
+    paginated_response["items"] = PRODUCT_SERIALIZER.many(paginated_response["items"])
+    return json_response(paginated_response)
+
+
+@router.get("/autocomplete")
+async def autocomplete_products(
+    q: str = Query(..., min_length=1),
+    limit: int = Query(10, ge=1, le=50),
+):
+    return product_name_index.search(q, limit=limit)
 
 
 @router.get("/{id}")
@@ -47,9 +94,7 @@ async def get_single_product(
     id: str,
     db: AsyncIOMotorDatabase = Depends(get_database),
 ):
-    product = await db["products"].find_one({"_id": PyObjectId(id)})
-    product = transform_mongo_data(product)
-    return product
+    return await get_cached_product(id, db)
 
 
 @router.get("")
@@ -58,45 +103,40 @@ async def get_products(
     status: Optional[ProductStatus] = None,
     page: int = Query(1, ge=1),
     page_size: int = Query(10, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description=CURSOR_HELP),
     db: AsyncIOMotorDatabase = Depends(get_database),
 ):
-    product_status = (
-        {"$in": ["available"]}
-        if status == "available"
-        else (
-            {"$in": ["unavailable"]}
-            if status == "unavailable"
-            else {"$in": ["available", "unavailable", "out of stock"]}
+    query = build_products_query(category, status)
+    page_stages = [LIST_IMAGES_STAGE, {"$project": PRODUCT_PROJECTION}]
+    if cursor is not None:
+        paginated_response = await paginate_cursor(
+            db["products"],
+            query,
+            cursor=cursor,
+            page_size=page_size,
+            page_stages=page_stages,
         )
-    )
-    query = (
-        {"status": product_status, "category": category}
-        if category
-        else {"status": product_status}
-    )
+        paginated_response["items"] = PRODUCT_SERIALIZER.many(
+            paginated_response["items"]
+        )
+        return json_response(paginated_response)
 
-    pipeline = [
-        {"$match": query},
-        {
-            "$lookup": {
-                "from": "product_images",
-                "localField": "_id",
-                "foreignField": "product_id",
-                "as": "images",
-            }
-        },
-    ]
-    products_with_images = await db["products"].aggregate(pipeline).to_list(length=None)
-    paginated_response = paginate(
-        transform_mongo_data(products_with_images), page=page, page_size=page_size
+    pipeline = [{"$match": query}, {"$sort": {"_id": 1}}]
+    paginated_response = await paginate_aggregate(
+        db["products"],
+        pipeline,
+        page=page,
+        page_size=page_size,
+        page_stages=page_stages,
     )
-    return paginated_response
+    paginated_response["items"] = PRODUCT_SERIALIZER.many(paginated_response["items"])
+    return json_response(paginated_response)
 
 
 @router.post("", response_model=ProductDetailSchema)
 async def create_product(
     product: ProductCreateSchema,
-    current_user=Depends(auth_handler.auth_wrapper),
+    req_user=Depends(auth_handler.user_wrapper),
     db: AsyncIOMotorDatabase = Depends(get_database),
 ):
     product_in_db = await db["products"].find_one(
@@ -109,52 +149,89 @@ async def create_product(
     if product_in_db:
         raise HTTPException(status_code=403, detail="Product already exists.")
 
-    req_user = await get_current_user(current_user, db)
     if not hasCreateProductPermission(req_user):
         raise HTTPException(
             status_code=403,
             detail="Only wholesalers or admins can perform this action.",
         )
 
-    new_product = await db["products"].insert_one(product.dict(by_alias=True))
+    new_product = await db["products"].insert_one(
+        {**product.dict(by_alias=True), "version": 1}
+    )
+    product_name_index.add(str(new_product.inserted_id), product.name)
     created_product = await db["products"].find_one({"_id": new_product.inserted_id})
     created_product = transform_mongo_data(created_product)
     return created_product
 
 
+@router.post("/bulk")
+async def bulk_create_products(
+    products: List[ProductCreateSchema],
+    update_existing: bool = False,
+    req_user=Depends(auth_handler.user_wrapper),
+    db: AsyncIOMotorDatabase = Depends(get_database),
+):
+    if not hasCreateProductPermission(req_user):
+        raise HTTPException(
+            status_code=403,
+            detail="Only wholesalers or admins can perform this action.",
+        )
+
+    if len(products) > BULK_MAX_PRODUCTS:
+        msg = f"At most {BULK_MAX_PRODUCTS} products can be sent at once."
+        raise HTTPException(status_code=400, detail=msg)
+
+    seller_id = None if hasAdminPermission(req_user) else str(req_user["_id"])
+    results = await bulk_write_products(db, products, update_existing, seller_id)
+    return {
+        "created": sum(1 for result in results if result["status"] == "created"),
+        "updated": sum(1 for result in results if result["status"] == "updated"),
+        "errors": sum(1 for result in results if result["status"] == "error"),
+        "results": results,
+    }
+
+
 @router.patch("/{id}", response_model=ProductDetailSchema)
 async def update_product(
     id: str,
     product: ProductCreateSchema,
-    current_user=Depends(auth_handler.auth_wrapper),
+    req_user=Depends(auth_handler.user_wrapper),
     db: AsyncIOMotorDatabase = Depends(get_database),
 ):
     product_in_db = await db["products"].find_one({"_id": PyObjectId(id)})
     if not product_in_db:
         raise HTTPException(status_code=403, detail="Product not found.")
 
-    req_user = await get_current_user(current_user, db)
     if not (
         hasAdminPermission(req_user) or req_user["_id"] == product_in_db["seller_id"]
     ):
         msg = "Only admins or product owner can perform this action."
         raise HTTPException(status_code=403, detail=msg)
 
-    new_product = await db["products"].insert_one(product.dict(by_alias=True))
-    created_product = await db["products"].find_one({"_id": new_product.inserted_id})
-    created_product = transform_mongo_data(created_product)
-    return created_product
+    query, update = product_update(
+        product_in_db, product.dict(by_alias=True, exclude={"created_at"})
+    )
+    result = await db["products"].update_one(query, update)
+    if not result.matched_count:
+        raise HTTPException(status_code=409, detail=PRODUCT_CHANGED)
+    product_cache.invalidate(id)
+    price_table.invalidate(id)
+    product_name_index.add(id, product.name)
+    updated_product = await db["products"].find_one(
+        {"_id": PyObjectId(id)}, PRODUCT_PROJECTION
+    )
+    updated_product = transform_mongo_data(updated_product)
+    return updated_product
 
 
-@router.post("/{id}/images/", response_model=ProductImageSchema)
+@router.post("/{id}/images/", status_code=status.HTTP_202_ACCEPTED)
 async def upload_product_image(
     id: str,
     file: UploadFile = File(...),
-    current_user=Depends(auth_handler.auth_wrapper),
+    req_user=Depends(auth_handler.user_wrapper),
     db: AsyncIOMotorDatabase = Depends(get_database),
 ):
     product = await db["products"].find_one({"_id": PyObjectId(id)})
-    req_user = await get_current_user(current_user, db)
     if not hasCreateProductPermission(req_user):
         raise HTTPException(status_code=400, detail="Not allowed, contact admin")
 
@@ -169,39 +246,20 @@ async def upload_product_image(
             status_code=400, detail="Invalid file type. Only JPEG and PNG are allowed."
         )
 
-    alt_text = f"{file.filename.split('.')[0]}.{file.filename.split('.')[-1]}"
-    file_name = f"{uuid.uuid4()}"
-    res = cloudinary.uploader.upload(file.file, public_id=file_name)
-    image_url = res.get("url")
-
-    image = await db["product_images"].insert_one(
-        {
-            "product_id": product["_id"],
-            "url": image_url,
-            "alt_text": alt_text,
-            "created_at": datetime.now(),
-        }
+    job = await upload_pipeline.submit(
+        db, file, "product_image", id, req_user["_id"], save_product_image
     )
-    new_image = await db["product_images"].find_one({"_id": image.inserted_id})
-    new_image = transform_mongo_data(new_image)
-
-    await db["products"].find_one_and_update(
-        {"_id": PyObjectId(id)},
-        {"$push": {"images": new_image}},
-        return_document=ReturnDocument.AFTER,
-    )
-    return new_image
+    return {"job_id": str(job["_id"]), "status": job["status"]}
 
 
 @router.delete("/{id}/images")
 async def delete_product_image(
     id: str,
     image_id: str,
-    current_user=Depends(auth_handler.auth_wrapper),
+    req_user=Depends(auth_handler.user_wrapper),
     db: AsyncIOMotorDatabase = Depends(get_database),
 ):
     product = await db["products"].find_one({"_id": PyObjectId(id)})
-    req_user = await get_current_user(current_user, db)
     if not hasCreateProductPermission(req_user):
         raise HTTPException(status_code=400, detail="Not allowed, contact admin")
 
@@ -211,4 +269,8 @@ async def delete_product_image(
     ):
         raise HTTPException(status_code=400, detail="Not allowed, contact admin")
 
-    db["product_images"].delete_one({"_id": PyObjectId(image_id)})
+    await db["product_images"].delete_one({"_id": PyObjectId(image_id)})
+    await db["products"].update_one(
+        {"_id": PyObjectId(id)}, {"$pull": {"images": {"id": image_id}}}
+    )
+    product_cache.invalidate(id)
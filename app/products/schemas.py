@@ -34,7 +34,7 @@ class ProductCreateSchema(BaseModel):
     category: str
     unit: str
     price_per_unit: float
-    stock_quantity: str
+    stock_quantity: int
     seller_id: str
     is_available: bool = True
     created_at: datetime = datetime.now()
@@ -46,7 +46,7 @@ class ProductDetailSchema(BaseModel):
     description: str
     category: str
     price_per_unit: float
-    stock_quantity: str
+    stock_quantity: int
     unit: str
     seller_id: str
     is_available: bool
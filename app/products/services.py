@@ -1,3 +1,134 @@
+from datetime import datetime
+
+from bson import ObjectId
+from pymongo import IndexModel, InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from app.core import settings
+from app.core._id import PyObjectId
+from app.core.cache import TTLCache
+from app.core.helpers import MongoSerializer, transform_mongo_data
+from app.core.indexes import register_indexes, register_query
+from app.core.search import PrefixIndex
+from app.products.prices import price_table
+
+register_indexes(
+    "products",
+    [
+        IndexModel(
+            [("status", 1), ("category", 1), ("_id", 1)], name="status_category"
+        ),
+        IndexModel(
+            [("seller_id", 1), ("name", 1), ("description", 1)], name="seller_name"
+        ),
+        IndexModel(
+            [("name", "text"), ("description", "text")],
+            name="name_description_text",
+            weights={"name": 10, "description": 1},
+        ),
+    ],
+)
+register_indexes("product_images", [IndexModel("product_id", name="product_id")])
+register_query(
+    "products_list",
+    "products",
+    {"status": {"$in": ["available"]}, "category": "grains"},
+    sort=[("_id", 1)],
+)
+register_query("product_images", "product_images", {"product_id": ObjectId()})
+
+# Bookkeeping of reserve_stock, never part of a product response.
+PRODUCT_PROJECTION = {"reservation_tokens": 0}
+
+# List views only carry the first few images, as thumbnails.
+LIST_IMAGES_STAGE = {
+    "$addFields": {
+        "images": {
+            "$map": {
+                "input": {
+                    "$slice": [
+                        {"$ifNull": ["$images", []]},
+                        settings.PRODUCT_LIST_IMAGES,
+                    ]
+                },
+                "as": "image",
+                "in": {
+                    "id": "$$image.id",
+                    "url": {"$ifNull": ["$$image.thumbnail_url", "$$image.url"]},
+                    "alt_text": "$$image.alt_text",
+                },
+            }
+        }
+    }
+}
+
+PRODUCT_SERIALIZER = MongoSerializer(
+    object_ids=("seller_id",),
+    nested={"images": MongoSerializer(object_ids=("product_id",))},
+)
+
+PRODUCT_EXPORT_FIELDS = [
+    "id",
+    "name",
+    "description",
+    "category",
+    "unit",
+    "price_per_unit",
+    "stock_quantity",
+    "seller_id",
+    "is_available",
+    "status",
+    "created_at",
+]
+
+product_cache = TTLCache(
+    "products",
+    maxsize=settings.PRODUCT_CACHE_SIZE,
+    ttl=settings.PRODUCT_CACHE_TTL,
+    enabled=settings.PRODUCT_CACHE_ENABLED,
+)
+
+
+product_name_index = PrefixIndex()
+
+
+async def warm_product_name_index(db):
+    cursor = db["products"].find({}, {"name": 1}).batch_size(1000)
+    product_name_index.rebuild(
+        [(str(product["_id"]), product["name"]) async for product in cursor]
+    )
+
+
+def build_products_query(category=None, status=None):
+    product_status = (
+        {"$in": ["available"]}
+        if status == "available"
+        else (
+            {"$in": ["unavailable"]}
+            if status == "unavailable"
+            else {"$in": ["available", "unavailable", "out of stock"]}
+        )
+    )
+    return (
+        {"status": product_status, "category": category}
+        if category
+        else {"status": product_status}
+    )
+
+
+async def get_cached_product(id: str, db):
+    product = product_cache.get(id)
+    if product is None:
+        product = await db["products"].find_one(
+            {"_id": PyObjectId(id)}, PRODUCT_PROJECTION
+        )
+        if product is None:
+            return None
+        product = transform_mongo_data(product)
+        product_cache.set(id, product)
+    return product
+
+
 def get_products_response(products: list):
     return [
         {
@@ -14,3 +145,155 @@ def get_products_response(products: list):
         }
         for i in products
     ]
+
+
+async def save_product_image(db, job, uploaded):
+    file_name = job["file_name"]
+    alt_text = f"{file_name.split('.')[0]}.{file_name.split('.')[-1]}"
+    image = {
+        "product_id": PyObjectId(job["target_id"]),
+        "url": uploaded["url"],
+        "thumbnail_url": uploaded["thumbnail_url"],
+        "alt_text": alt_text,
+        "created_at": datetime.now(),
+    }
+    await db["product_images"].insert_one(image)
+    new_image = transform_mongo_data(image)
+
+    await db["products"].update_one(
+        {"_id": PyObjectId(job["target_id"])}, {"$push": {"images": new_image}}
+    )
+    product_cache.invalidate(job["target_id"])
+    return new_image
+
+
+BULK_MAX_PRODUCTS = 5000
+BULK_QUERY_CHUNK = 1000
+
+
+PRODUCT_CHANGED = "Product was changed by another request, reload it and retry."
+
+
+def _product_key(product: dict) -> tuple:
+    return (product["name"], product["description"], product["seller_id"])
+
+
+def product_update(product: dict, row: dict) -> tuple:
+    """
+    The (filter, update) writing `row` over `product` as it was read. Stock
+    moves by the difference to the value read, so reservations taken since
+    then are kept; the write only matches while the version is unchanged and
+    enough stock is left for a decrease.
+    """
+    row = dict(row)
+    delta = row.pop("stock_quantity") - product.get("stock_quantity", 0)
+    query = {"_id": product["_id"], "version": product.get("version")}
+    if delta < 0:
+        query["stock_quantity"] = {"$gte": -delta}
+    update = {"$set": row, "$inc": {"version": 1, "stock_quantity": delta}}
+    return query, update
+
+
+async def find_existing_products(db, keys: list) -> dict:
+    existing = {}
+    for start in range(0, len(keys), BULK_QUERY_CHUNK):
+        chunk = keys[start : start + BULK_QUERY_CHUNK]
+        query = {
+            "$or": [
+                {"name": name, "description": description, "seller_id": seller_id}
+                for name, description, seller_id in chunk
+            ]
+        }
+        projection = {
+            "name": 1,
+            "description": 1,
+            "seller_id": 1,
+            "stock_quantity": 1,
+            "version": 1,
+        }
+        async for product in db["products"].find(query, projection):
+            existing[_product_key(product)] = product
+    return existing
+
+
+async def bulk_write_products(
+    db, products: list, update_existing: bool, seller_id=None
+) -> list:
+    """
+    Create (and optionally update) a batch of products with one duplicate
+    lookup and one unordered bulk_write. Returns one result per input row.
+    When `seller_id` is given (non-admin callers) rows for any other seller
+    are rejected, so nobody can create or overwrite another seller's products.
+    """
+    rows = [product.dict(by_alias=True) for product in products]
+    batch = ObjectId()
+    results = [{"index": index} for index in range(len(rows))]
+    for index, row in enumerate(rows):
+        if seller_id is not None and str(row["seller_id"]) != seller_id:
+            detail = "Products can only be written for your own seller_id."
+            results[index].update(status="error", detail=detail)
+
+    allowed = [row for index, row in enumerate(rows) if "status" not in results[index]]
+    existing = await find_existing_products(
+        db, list({_product_key(r) for r in allowed})
+    )
+
+    operations, operation_rows, seen = [], [], set()
+    for index, row in enumerate(rows):
+        if results[index].get("status") == "error":
+            continue
+        key = _product_key(row)
+        if key in seen:
+            results[index].update(status="error", detail="Duplicate row in request.")
+            continue
+        seen.add(key)
+
+        if key in existing:
+            if not update_existing:
+                results[index].update(status="error", detail="Product already exists.")
+                continue
+            row.pop("created_at", None)
+            query, update = product_update(existing[key], row)
+            update["$set"]["write_batch"] = batch
+            operations.append(UpdateOne(query, update))
+            results[index].update(status="updated", id=str(existing[key]["_id"]))
+        else:
+            row["_id"] = ObjectId()
+            row["version"] = 1
+            operations.append(InsertOne(row))
+            results[index].update(status="created", id=str(row["_id"]))
+        operation_rows.append(index)
+
+    if operations:
+        try:
+            await db["products"].bulk_write(operations, ordered=False)
+        except BulkWriteError as e:
+            for error in e.details["writeErrors"]:
+                result = results[operation_rows[error["index"]]]
+                result.pop("id", None)
+                result.update(status="error", detail=error["errmsg"])
+
+    updated = [result for result in results if result.get("status") == "updated"]
+    if updated:
+        # Updates of products changed since they were read did not match,
+        # the batch marker tells which ones went through.
+        ids = [ObjectId(result["id"]) for result in updated]
+        cursor = db["products"].find(
+            {"_id": {"$in": ids}, "write_batch": batch}, {"_id": 1}
+        )
+        written = {str(product["_id"]) async for product in cursor}
+        await db["products"].update_many(
+            {"_id": {"$in": ids}, "write_batch": batch},
+            {"$unset": {"write_batch": ""}},
+        )
+        for result in updated:
+            if result["id"] not in written:
+                result.pop("id")
+                result.update(status="error", detail=PRODUCT_CHANGED)
+
+    for index, row in enumerate(rows):
+        if results[index]["status"] != "error":
+            product_cache.invalidate(results[index]["id"])
+            price_table.invalidate(results[index]["id"])
+            product_name_index.add(results[index]["id"], row["name"])
+    return results
@@ -0,0 +1,98 @@
+import asyncio
+import sys
+
+from app.core.database import get_database
+
+
+async def reconcile_product_images(db):
+    """
+    Rebuild the embedded `images` array of every product from the
+    product_images collection. The whole job runs inside MongoDB.
+    """
+    pipeline = [
+        {
+            "$lookup": {
+                "from": "product_images",
+                "localField": "_id",
+                "foreignField": "product_id",
+                "as": "product_images",
+            }
+        },
+        {
+            "$project": {
+                "images": {
+                    "$map": {
+                        "input": "$product_images",
+                        "as": "image",
+                        "in": {
+                            "id": {"$toString": "$$image._id"},
+                            "product_id": {"$toString": "$$image.product_id"},
+                            "url": "$$image.url",
+                            "thumbnail_url": "$$image.thumbnail_url",
+                            "alt_text": "$$image.alt_text",
+                            "created_at": "$$image.created_at",
+                        },
+                    }
+                }
+            }
+        },
+        {
+            "$merge": {
+                "into": "products",
+                "on": "_id",
+                "whenMatched": "merge",
+                "whenNotMatched": "discard",
+            }
+        },
+    ]
+    await db["products"].aggregate(pipeline).to_list(length=None)
+
+
+async def migrate_stock_quantity(db):
+    """
+    Convert legacy string stock quantities to integers, unparseable values
+    become 0 so the product can't be oversold.
+    """
+    result = await db["products"].update_many(
+        {"stock_quantity": {"$not": {"$type": "number"}}},
+        [
+            {
+                "$set": {
+                    "stock_quantity": {
+                        "$convert": {
+                            "input": "$stock_quantity",
+                            "to": "int",
+                            "onError": 0,
+                            "onNull": 0,
+                        }
+                    }
+                }
+            }
+        ],
+    )
+    return result.modified_count
+
+
+async def drop_reservation_markers(db):
+    """
+    Remove the per-order `reservations` markers older versions of
+    reserve_stock left on every product; reservation_tokens replaced them.
+    """
+    result = await db["products"].update_many(
+        {"reservations": {"$exists": True}}, {"$unset": {"reservations": ""}}
+    )
+    return result.modified_count
+
+
+TASKS = {
+    "reconcile_images": reconcile_product_images,
+    "migrate_stock": migrate_stock_quantity,
+    "drop_reservation_markers": drop_reservation_markers,
+}
+
+
+if __name__ == "__main__":
+    # python -m app.products.tasks reconcile_images|migrate_stock|drop_reservation_markers
+    task = sys.argv[1] if len(sys.argv) > 1 else "reconcile_images"
+    result = asyncio.run(TASKS[task](get_database()))
+    print(f"{task} done: {result}")
@@ -0,0 +1,33 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from app.accounts.permissions import hasAdminPermission
+from app.core._id import PyObjectId
+from app.core.auth import AuthHandler
+from app.core.database import get_database
+from app.core.helpers import transform_mongo_data
+from app.uploads.schemas import ImageJobSchema
+from app.uploads.services import upload_pipeline
+
+auth_handler = AuthHandler()
+router = APIRouter(prefix="/uploads", tags=["Uploads"])
+
+
+@router.get("/{id}", response_model=ImageJobSchema)
+async def get_image_job(
+    id: str,
+    wait: float = Query(0, ge=0, le=30, description="Seconds to wait for the job"),
+    req_user=Depends(auth_handler.user_wrapper),
+    db: AsyncIOMotorDatabase = Depends(get_database),
+):
+    if wait:
+        await upload_pipeline.wait(id, wait)
+
+    job = await db["image_jobs"].find_one({"_id": PyObjectId(id)})
+    if not job:
+        raise HTTPException(status_code=404, detail="Upload not found")
+
+    if not (hasAdminPermission(req_user) or req_user["_id"] == job["user_id"]):
+        raise HTTPException(status_code=403, detail="Not allowed, contact admin")
+
+    return transform_mongo_data(job)
@@ -0,0 +1,22 @@
+from datetime import datetime
+from enum import Enum
+from typing import Dict, Optional
+
+from pydantic import BaseModel
+
+
+class ImageJobStatus(str, Enum):
+    PENDING = "pending"
+    DONE = "done"
+    FAILED = "failed"
+
+
+class ImageJobSchema(BaseModel):
+    id: str
+    kind: str
+    target_id: str
+    status: ImageJobStatus
+    result: Optional[Dict] = None
+    error: Optional[str] = None
+    created_at: datetime
+    updated_at: datetime
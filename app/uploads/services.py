@@ -0,0 +1,168 @@
+import asyncio
+import contextlib
+import glob
+import os
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict
+
+from bson import ObjectId
+from fastapi import HTTPException, UploadFile
+from starlette.concurrency import run_in_threadpool
+
+from app.core import settings
+from app.uploads.schemas import ImageJobStatus
+from app.uploads.storage import get_storage
+
+
+def remove_spool(path: str):
+    with contextlib.suppress(OSError):
+        os.remove(path)
+
+
+def spool_upload(file: UploadFile) -> str:
+    file.file.seek(0)
+    with tempfile.NamedTemporaryFile(delete=False, prefix="upload-") as spool:
+        try:
+            shutil.copyfileobj(file.file, spool)
+        except BaseException:
+            remove_spool(spool.name)
+            raise
+    return spool.name
+
+
+class UploadPipeline:
+    """
+    Runs the blocking storage upload on a bounded thread pool so the event
+    loop never waits on the network. Jobs are recorded in `image_jobs` and
+    the client polls (or waits on) them by id.
+    """
+
+    def __init__(self, storage, workers: int, max_pending: int, retries: int):
+        self.storage = storage
+        self.executor = ThreadPoolExecutor(workers, thread_name_prefix="upload")
+        self.max_pending = max_pending
+        self.retries = retries
+        self.pending = 0
+        self._events: Dict[str, asyncio.Event] = {}
+        self._tasks = set()
+
+    async def submit(
+        self,
+        db,
+        file: UploadFile,
+        kind: str,
+        target_id: str,
+        user_id,
+        on_complete: Callable[..., Awaitable[dict]],
+    ) -> dict:
+        if self.pending >= self.max_pending:
+            raise HTTPException(
+                status_code=503, detail="Too many uploads in progress, retry later."
+            )
+
+        self.pending += 1
+        path = None
+        try:
+            path = await run_in_threadpool(spool_upload, file)
+            job = {
+                "_id": ObjectId(),
+                "kind": kind,
+                "target_id": target_id,
+                "user_id": user_id,
+                "file_name": file.filename,
+                "status": ImageJobStatus.PENDING,
+                "created_at": datetime.now(),
+                "updated_at": datetime.now(),
+            }
+            await db["image_jobs"].insert_one(job)
+        except Exception:
+            self.pending -= 1
+            if path is not None:
+                remove_spool(path)
+            raise
+
+        self._events[str(job["_id"])] = asyncio.Event()
+        task = asyncio.create_task(self._run(db, job, path, on_complete))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job
+
+    async def _upload(self, path: str, public_id: str) -> dict:
+        loop = asyncio.get_running_loop()
+        attempts = max(self.retries, 1)
+        for attempt in range(attempts):
+            try:
+                return await loop.run_in_executor(
+                    self.executor, self.storage.upload, path, public_id
+                )
+            except Exception:
+                if attempt == attempts - 1:
+                    raise
+                await asyncio.sleep(0.5 * 2**attempt)
+
+    async def _run(self, db, job, path, on_complete):
+        update = {"status": ImageJobStatus.FAILED, "error": "Upload was interrupted."}
+        try:
+            uploaded = await self._upload(path, str(job["_id"]))
+            result = await on_complete(db, job, uploaded)
+            update = {"status": ImageJobStatus.DONE, "result": result}
+        except Exception as e:
+            update = {"status": ImageJobStatus.FAILED, "error": str(e)}
+        finally:
+            self.pending -= 1
+            remove_spool(path)
+            update["updated_at"] = datetime.now()
+            try:
+                # Shielded so the job is recorded even if we are cancelled.
+                await asyncio.shield(
+                    db["image_jobs"].update_one({"_id": job["_id"]}, {"$set": update})
+                )
+            except Exception as e:
+                print(f"Could not record image job {job['_id']}: {e}")
+            finally:
+                self._events.pop(str(job["_id"])).set()
+
+    async def cleanup_stale(self, db):
+        """
+        Fail the jobs and remove the spool files left behind by a process that
+        died mid-upload. Only what is older than UPLOAD_STALE_AFTER is touched,
+        so jobs running in other workers are left alone.
+        """
+        cutoff = datetime.now() - timedelta(seconds=settings.UPLOAD_STALE_AFTER)
+        await db["image_jobs"].update_many(
+            {"status": ImageJobStatus.PENDING, "created_at": {"$lt": cutoff}},
+            {
+                "$set": {
+                    "status": ImageJobStatus.FAILED,
+                    "error": "Upload was interrupted.",
+                    "updated_at": datetime.now(),
+                }
+            },
+        )
+        for path in glob.glob(os.path.join(tempfile.gettempdir(), "upload-*")):
+            with contextlib.suppress(OSError):
+                if os.path.getmtime(path) < cutoff.timestamp():
+                    os.remove(path)
+
+    async def wait(self, job_id: str, timeout: float):
+        """
+        Wait for a job running in this process, returns at once otherwise.
+        """
+        event = self._events.get(job_id)
+        if event is None:
+            return
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+
+upload_pipeline = UploadPipeline(
+    get_storage(),
+    workers=settings.UPLOAD_WORKERS,
+    max_pending=settings.UPLOAD_MAX_PENDING,
+    retries=settings.UPLOAD_RETRIES,
+)
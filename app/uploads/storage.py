@@ -0,0 +1,53 @@
+import os
+import shutil
+
+import cloudinary
+import cloudinary.uploader
+from cloudinary.utils import cloudinary_url
+
+from app.core import settings
+
+
+class CloudinaryStorage:
+    def __init__(self):
+        cloudinary.config(
+            cloud_name=settings.CLOUD_NAME,
+            api_key=settings.CLOUDINARY_API_KEY,
+            api_secret=settings.CLOUDINARY_API_SECRET,
+        )
+
+    def upload(self, path: str, public_id: str) -> dict:
+        res = cloudinary.uploader.upload(path, public_id=public_id)
+        thumbnail_url, _ = cloudinary_url(
+            public_id,
+            width=settings.PRODUCT_THUMBNAIL_SIZE,
+            height=settings.PRODUCT_THUMBNAIL_SIZE,
+            crop="fill",
+        )
+        return {"url": res.get("url"), "thumbnail_url": thumbnail_url}
+
+
+class LocalStorage:
+    """
+    Stores uploads on disk under `directory`, served from /static. Used in
+    development and tests in place of Cloudinary.
+    """
+
+    def __init__(self, directory: str = settings.UPLOAD_LOCAL_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def upload(self, path: str, public_id: str) -> dict:
+        shutil.copyfile(path, os.path.join(self.directory, public_id))
+        url = f"/{self.directory.strip('/')}/{public_id}"
+        return {"url": url, "thumbnail_url": url}
+
+
+STORAGE_BACKENDS = {
+    "cloudinary": CloudinaryStorage,
+    "local": LocalStorage,
+}
+
+
+def get_storage():
+    return STORAGE_BACKENDS[settings.UPLOAD_STORAGE]()
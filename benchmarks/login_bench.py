@@ -0,0 +1,57 @@
+"""
+Measure password verification throughput, the CPU cost of a login, on the
+event loop and on the process pool with a growing number of workers. Reads
+the work factor from the app settings (PASSWORD_HASH_ROUNDS), so it needs
+the same environment as the app.
+
+    python -m benchmarks.login_bench --logins 64 --max-workers 8
+"""
+
+import argparse
+import asyncio
+import os
+import time
+
+from app.core.passwords import PasswordHasher, hash_password, verify_password
+
+PASSWORD = "correct horse battery staple"
+
+
+async def run_inline(hashed, logins):
+    started = time.perf_counter()
+    for _ in range(logins):
+        verify_password(PASSWORD, hashed)
+    return time.perf_counter() - started
+
+
+async def run_pool(hashed, logins, workers):
+    hasher = PasswordHasher(workers, max_pending=logins)
+    # Start the worker processes before timing.
+    await asyncio.gather(*(hasher.verify(PASSWORD, hashed) for _ in range(workers)))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(hasher.verify(PASSWORD, hashed) for _ in range(logins)))
+    elapsed = time.perf_counter() - started
+    hasher.shutdown()
+    return elapsed
+
+
+async def main(args):
+    hashed = hash_password(PASSWORD)
+    print(f"{'mode':<12}{'workers':>8}{'logins/s':>12}")
+
+    elapsed = await run_inline(hashed, args.logins)
+    print(f"{'event loop':<12}{'-':>8}{args.logins / elapsed:>12.1f}")
+
+    workers = 1
+    while workers <= args.max_workers:
+        elapsed = await run_pool(hashed, args.logins, workers)
+        print(f"{'pool':<12}{workers:>8}{args.logins / elapsed:>12.1f}")
+        workers *= 2
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--logins", type=int, default=64)
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    asyncio.run(main(parser.parse_args()))
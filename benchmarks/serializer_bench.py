@@ -0,0 +1,93 @@
+"""
+Compare transform_mongo_data with the compiled MongoSerializer on product and
+order documents shaped like the ones the list endpoints return. Uses the
+serializers of the app modules, so it needs the same environment as the app.
+
+    python -m benchmarks.serializer_bench
+"""
+
+import json
+import timeit
+from datetime import datetime
+
+from bson import ObjectId
+
+from app.core.helpers import _json_default, transform_mongo_data
+from app.orders.services import ORDER_SERIALIZER
+from app.products.services import PRODUCT_SERIALIZER
+
+
+def make_product():
+    return {
+        "_id": ObjectId(),
+        "name": "Long grain parboiled rice",
+        "description": "50kg bag of long grain parboiled rice, stone free. " * 3,
+        "category": "grains",
+        "unit": "bag",
+        "price_per_unit": 72000.0,
+        "stock_quantity": "340",
+        "seller_id": str(ObjectId()),
+        "is_available": True,
+        "status": "available",
+        "created_at": datetime.now(),
+        "images": [
+            {"id": str(ObjectId()), "url": "https://res.cloudinary.com/x/image.jpg"}
+            for _ in range(3)
+        ],
+    }
+
+
+def make_order(lines=20):
+    order_id = ObjectId()
+    return {
+        "_id": order_id,
+        "buyer_id": ObjectId(),
+        "seller_ids": [str(ObjectId())],
+        "status": "pending",
+        "total_price": 1440000.0,
+        "created_at": datetime.now(),
+        "updated_at": datetime.now(),
+        "items": [
+            {
+                "order_id": str(order_id),
+                "product_id": str(ObjectId()),
+                "seller_id": str(ObjectId()),
+                "product_name": "Long grain parboiled rice",
+                "product_description": "50kg bag of long grain parboiled rice.",
+                "price": 72000.0,
+                "quantity": 1,
+                "subtotal": 72000.0,
+            }
+            for _ in range(lines)
+        ],
+    }
+
+
+def dumps(data):
+    return json.dumps(data, default=_json_default, separators=(",", ":")).encode()
+
+
+def run(name, documents, serializer, number=20):
+    assert serializer.many(documents) == transform_mongo_data(documents)
+    cases = {
+        "serialize": (
+            lambda: transform_mongo_data(documents),
+            lambda: serializer.many(documents),
+        ),
+        "serialize+json": (
+            lambda: dumps(transform_mongo_data(documents)),
+            lambda: dumps(serializer.many(documents)),
+        ),
+    }
+    for case, (current, compiled) in cases.items():
+        old = timeit.timeit(current, number=number) / number
+        new = timeit.timeit(compiled, number=number) / number
+        print(
+            f"{name:<9} {case:<15} transform_mongo_data {old * 1000:7.2f} ms  "
+            f"MongoSerializer {new * 1000:7.2f} ms  x{old / new:.1f}"
+        )
+
+
+if __name__ == "__main__":
+    run("products", [make_product() for _ in range(100)], PRODUCT_SERIALIZER)
+    run("orders", [make_order() for _ in range(100)], ORDER_SERIALIZER)
@@ -0,0 +1,84 @@
+"""
+Fire many concurrent reservations at a handful of products and check that
+stock never goes negative and every unit taken belongs to a successful order.
+Needs a running MongoDB (MONGO_DB_URL, defaults to localhost).
+
+    python -m benchmarks.stock_contention_bench --orders 2000 --stock 500
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import time
+from collections import Counter
+
+from bson import ObjectId
+from fastapi import HTTPException
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from app.orders.inventory import reserve_stock
+
+
+async def place_order(db, product_ids, max_lines):
+    quantities = Counter(
+        {
+            str(id): random.randint(1, 5)
+            for id in random.sample(product_ids, random.randint(1, max_lines))
+        }
+    )
+    try:
+        await reserve_stock(db, ObjectId(), quantities)
+        return quantities
+    except HTTPException:
+        return None
+
+
+async def main(args):
+    client = AsyncIOMotorClient(os.environ.get("MONGO_DB_URL", "mongodb://localhost"))
+    db = client["foodnest_stock_bench"]
+    await db["products"].drop()
+    result = await db["products"].insert_many(
+        [{"name": f"p{i}", "stock_quantity": args.stock} for i in range(args.products)]
+    )
+    product_ids = result.inserted_ids
+
+    started = time.perf_counter()
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def bounded():
+        async with semaphore:
+            return await place_order(db, product_ids, args.lines)
+
+    orders = await asyncio.gather(*[bounded() for _ in range(args.orders)])
+    elapsed = time.perf_counter() - started
+
+    taken = Counter()
+    for quantities in filter(None, orders):
+        taken.update(quantities)
+
+    ok = True
+    async for product in db["products"].find():
+        expected = args.stock - taken[str(product["_id"])]
+        stock = product["stock_quantity"]
+        if stock < 0 or stock != expected:
+            ok = False
+            print(f"{product['name']}: stock {stock}, expected {expected}")
+
+    accepted = sum(1 for order in orders if order)
+    print(
+        f"{args.orders} orders in {elapsed:.2f}s ({args.orders / elapsed:.0f}/s), "
+        f"{accepted} accepted, {args.orders - accepted} rejected, "
+        f"stock {'consistent' if ok else 'INCONSISTENT'}"
+    )
+    await db["products"].drop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--orders", type=int, default=2000)
+    parser.add_argument("--products", type=int, default=10)
+    parser.add_argument("--stock", type=int, default=500)
+    parser.add_argument("--lines", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, default=100)
+    asyncio.run(main(parser.parse_args()))
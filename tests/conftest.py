@@ -0,0 +1,32 @@
+import os
+
+import pytest
+
+# app.core.settings reads these at import time; tests never reach the
+# services behind them.
+for key, value in {
+    "MONGO_DB_URL": "mongodb://localhost:27017",
+    "SECRET_KEY": "test-secret-key-with-at-least-32-bytes",
+    "ACCESS_TOKEN_EXPIRE_MINUTES": "30",
+    "REFRESH_TOKEN_EXPIRE_DAYS": "1",
+    "CLOUD_NAME": "test",
+    "CLOUDINARY_API_KEY": "test",
+    "CLOUDINARY_API_SECRET": "test",
+    "MAILGUN_API_KEY": "test",
+}.items():
+    os.environ.setdefault(key, value)
+
+
+@pytest.fixture
+def db(monkeypatch):
+    from mongomock.collection import BulkOperationBuilder
+    from mongomock_motor import AsyncMongoMockClient
+
+    # pymongo passes sort= to bulk updates, which mongomock does not know.
+    add_update = BulkOperationBuilder.add_update
+
+    def add_update_without_sort(self, *args, sort=None, **kwargs):
+        return add_update(self, *args, **kwargs)
+
+    monkeypatch.setattr(BulkOperationBuilder, "add_update", add_update_without_sort)
+    return AsyncMongoMockClient()["foodnest_test"]
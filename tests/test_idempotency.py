@@ -0,0 +1,207 @@
+import asyncio
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+from fastapi import HTTPException
+from pymongo.errors import PyMongoError
+
+from app.core import idempotency, settings
+from app.core.idempotency import COLLECTION, idempotent
+
+
+def new_key():
+    # The response cache is process wide, every test gets its own keys.
+    return str(uuid.uuid4())
+
+
+class Handler:
+    def __init__(self, response=None, gate=None):
+        self.calls = 0
+        self.response = response or {"ok": True}
+        self.gate = gate
+
+    async def __call__(self):
+        self.calls += 1
+        if self.gate is not None:
+            await self.gate.wait()
+        return self.response
+
+
+def test_replay_returns_the_stored_response(db):
+    key, handler = new_key(), Handler({"order": 1})
+
+    async def run():
+        first = await idempotent(db, key, "user", {"a": 1}, handler)
+        idempotency.idempotency_cache.clear()
+        second = await idempotent(db, key, "user", {"a": 1}, handler)
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert first == second == {"order": 1}
+    assert handler.calls == 1
+
+
+def test_key_reused_with_another_payload_is_rejected(db):
+    key, handler = new_key(), Handler()
+
+    async def run():
+        await idempotent(db, key, "user", {"a": 1}, handler)
+        await idempotent(db, key, "user", {"a": 2}, handler)
+
+    with pytest.raises(HTTPException) as e:
+        asyncio.run(run())
+    assert e.value.status_code == 422
+
+
+def test_concurrent_duplicate_waits_for_the_first_request(db):
+    key = new_key()
+
+    async def run():
+        handler = Handler({"order": 1}, gate=asyncio.Event())
+        first = asyncio.create_task(idempotent(db, key, "user", {}, handler))
+        await asyncio.sleep(0)
+        second = asyncio.create_task(idempotent(db, key, "user", {}, handler))
+        await asyncio.sleep(0.01)
+        handler.gate.set()
+        return await asyncio.gather(first, second), handler.calls
+
+    (first, second), calls = asyncio.run(run())
+    assert first == second == {"order": 1}
+    assert calls == 1
+
+
+def test_cancelled_request_releases_the_key(db):
+    key = new_key()
+
+    async def run():
+        handler = Handler(gate=asyncio.Event())
+        first = asyncio.create_task(idempotent(db, key, "user", {}, handler))
+        await asyncio.sleep(0.01)
+        waiter = asyncio.create_task(idempotent(db, key, "user", {}, handler))
+        await asyncio.sleep(0.01)
+
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        with pytest.raises(HTTPException) as e:
+            await asyncio.wait_for(waiter, 1)
+        assert e.value.status_code == 409
+        assert await db[COLLECTION].count_documents({}) == 0
+        assert idempotency._in_flight == {}
+
+        return await idempotent(db, key, "user", {}, Handler({"retried": True}))
+
+    assert asyncio.run(run()) == {"retried": True}
+
+
+def test_stale_pending_claim_is_taken_over(db):
+    key, handler = new_key(), Handler()
+    claimed_at = datetime.now() - timedelta(hours=1)
+
+    async def run():
+        await db[COLLECTION].insert_one(
+            {
+                "_id": f"user:{key}",
+                "fingerprint": "other",
+                "status": "pending",
+                "claimed_at": claimed_at,
+                "created_at": claimed_at,
+            }
+        )
+        return await idempotent(db, key, "user", {}, handler)
+
+    assert asyncio.run(run()) == {"ok": True}
+    assert handler.calls == 1
+
+
+def test_fresh_pending_claim_is_in_progress(db):
+    key = new_key()
+
+    async def run():
+        await db[COLLECTION].insert_one(
+            {
+                "_id": f"user:{key}",
+                "fingerprint": "other",
+                "status": "pending",
+                "claimed_at": datetime.now(),
+                "created_at": datetime.now(),
+            }
+        )
+        await idempotent(db, key, "user", {}, Handler())
+
+    with pytest.raises(HTTPException) as e:
+        asyncio.run(run())
+    assert e.value.status_code == 409
+
+
+def test_failed_response_write_keeps_the_claim(db, monkeypatch):
+    key, handler = new_key(), Handler({"order": 1})
+    collection = type(db[COLLECTION])
+
+    async def failing_update_one(self, *args, **kwargs):
+        raise PyMongoError("primary stepped down")
+
+    monkeypatch.setattr(idempotency, "STORE_ATTEMPTS", 2)
+    monkeypatch.setattr(collection, "update_one", failing_update_one)
+
+    async def run():
+        response = await idempotent(db, key, "user", {}, handler)
+        stored = await db[COLLECTION].find_one({"_id": f"user:{key}"})
+        return response, stored
+
+    response, stored = asyncio.run(run())
+    assert response == {"order": 1}
+    assert stored["status"] == "pending"
+
+    # Another worker sees the key in progress instead of running it again.
+    idempotency.idempotency_cache.clear()
+    with pytest.raises(HTTPException) as e:
+        asyncio.run(idempotent(db, key, "user", {}, handler))
+    assert e.value.status_code == 409
+    assert handler.calls == 1
+
+
+def test_cancelled_while_storing_keeps_the_response(db, monkeypatch):
+    key, handler = new_key(), Handler({"order": 1})
+    collection = type(db[COLLECTION])
+    update_one = collection.update_one
+
+    async def slow_update_one(self, *args, **kwargs):
+        await asyncio.sleep(0.05)
+        return await update_one(self, *args, **kwargs)
+
+    monkeypatch.setattr(collection, "update_one", slow_update_one)
+
+    async def run():
+        request = asyncio.create_task(idempotent(db, key, "user", {}, handler))
+        await asyncio.sleep(0.01)
+        request.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await request
+        await asyncio.sleep(0.1)
+        return await db[COLLECTION].find_one({"_id": f"user:{key}"})
+
+    stored = asyncio.run(run())
+    assert stored["status"] == "done"
+    assert stored["response"] == {"order": 1}
+    assert handler.calls == 1
+
+
+def test_slow_handler_keeps_its_lease(db, monkeypatch):
+    key = new_key()
+    monkeypatch.setattr(settings, "IDEMPOTENCY_LEASE", 0.06)
+
+    async def run():
+        handler = Handler(gate=asyncio.Event())
+        request = asyncio.create_task(idempotent(db, key, "user", {}, handler))
+        await asyncio.sleep(0.2)
+        # A retry reaching another worker, past the lease.
+        with pytest.raises(HTTPException) as e:
+            await idempotency._claim(db, f"user:{key}", "other", ObjectId())
+        handler.gate.set()
+        await request
+        return e.value.status_code, handler.calls
+
+    assert asyncio.run(run()) == (409, 1)
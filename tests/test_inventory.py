@@ -0,0 +1,98 @@
+import asyncio
+from collections import Counter
+
+import pytest
+from bson import ObjectId
+from fastapi import HTTPException
+
+from app.orders import inventory
+from app.orders.inventory import release_stock, reserve_stock
+
+
+def insert_products(db, stock):
+    products = [
+        {"_id": ObjectId(), "stock_quantity": quantity, "version": 1}
+        for quantity in stock
+    ]
+    asyncio.run(db["products"].insert_many(products))
+    return [str(product["_id"]) for product in products]
+
+
+def stock_of(db, ids):
+    async def read():
+        return [
+            (await db["products"].find_one({"_id": ObjectId(id)}))["stock_quantity"]
+            for id in ids
+        ]
+
+    return asyncio.run(read())
+
+
+def tokens_of(db, ids):
+    async def read():
+        return [
+            len(
+                (await db["products"].find_one({"_id": ObjectId(id)})).get(
+                    "reservation_tokens", []
+                )
+            )
+            for id in ids
+        ]
+
+    return asyncio.run(read())
+
+
+def test_reserve_takes_every_line(db):
+    ids = insert_products(db, [5, 5])
+
+    asyncio.run(reserve_stock(db, ObjectId(), Counter({ids[0]: 2, ids[1]: 5})))
+
+    assert stock_of(db, ids) == [3, 0]
+    assert tokens_of(db, ids) == [1, 1]
+
+
+def test_partial_failure_puts_back_the_lines_taken(db):
+    ids = insert_products(db, [5, 1, 5])
+    quantities = Counter({ids[0]: 2, ids[1]: 3, ids[2]: 4})
+
+    with pytest.raises(HTTPException) as e:
+        asyncio.run(reserve_stock(db, ObjectId(), quantities))
+
+    assert e.value.status_code == 409
+    assert e.value.detail["product_ids"] == [ids[1]]
+    assert stock_of(db, ids) == [5, 1, 5]
+    assert tokens_of(db, ids) == [0, 0, 0]
+
+
+def test_reservation_tokens_are_capped(db, monkeypatch):
+    monkeypatch.setattr(inventory, "RESERVATION_TOKENS", 2)
+    ids = insert_products(db, [5])
+
+    for _ in range(3):
+        asyncio.run(reserve_stock(db, ObjectId(), Counter({ids[0]: 1})))
+
+    assert stock_of(db, ids) == [2]
+    assert tokens_of(db, ids) == [2]
+
+
+def test_stale_price_version_is_rejected(db):
+    ids = insert_products(db, [5, 5])
+    versions = {ids[0]: 1, ids[1]: 0}
+
+    with pytest.raises(HTTPException) as e:
+        asyncio.run(
+            reserve_stock(db, ObjectId(), Counter({ids[0]: 1}), versions=versions)
+        )
+
+    assert e.value.status_code == 409
+    assert e.value.detail["message"] == "Product prices changed, review the order."
+    assert e.value.detail["product_ids"] == [ids[1]]
+    assert stock_of(db, ids) == [5, 5]
+
+
+def test_release_gives_stock_back(db):
+    ids = insert_products(db, [0])
+
+    asyncio.run(release_stock(db, Counter({ids[0]: 3})))
+
+    assert stock_of(db, ids) == [3]
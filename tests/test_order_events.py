@@ -0,0 +1,102 @@
+import asyncio
+
+import pytest
+from bson import ObjectId
+from pymongo.errors import AutoReconnect, OperationFailure
+
+from app.orders import events
+from app.orders.events import tail_order_changes
+
+
+class FakeStream:
+    def __init__(self, changes, error):
+        self.changes = list(changes)
+        self.error = error
+        self.resume_token = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.changes:
+            change = self.changes.pop(0)
+            self.resume_token = change["_id"]
+            return change
+        if self.error is not None:
+            raise self.error
+        await asyncio.Event().wait()
+
+
+class FakeOrders:
+    def __init__(self, streams):
+        self.streams = streams
+        self.resumed_after = []
+
+    def watch(self, pipeline, resume_after=None, **kwargs):
+        self.resumed_after.append(resume_after)
+        return self.streams.pop(0)
+
+
+def change(token):
+    order = {"_id": ObjectId(), "buyer_id": ObjectId(), "status": "pending"}
+    return {"_id": token, "operationType": "insert", "fullDocument": order}
+
+
+def tail(orders, monkeypatch, calls):
+    broadcast = []
+    monkeypatch.setattr(
+        events,
+        "broadcast_order_event",
+        lambda type, order: broadcast.append(order["_id"]),
+    )
+
+    async def run():
+        task = asyncio.create_task(tail_order_changes({"orders": orders}))
+        while len(orders.resumed_after) < calls:
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    # The first retry waits a second, keep the test fast.
+    sleep = asyncio.sleep
+    monkeypatch.setattr(events.asyncio, "sleep", lambda delay: sleep(min(delay, 0.01)))
+    asyncio.run(run())
+    return broadcast
+
+
+def test_stream_resumes_after_the_last_change(monkeypatch):
+    first, second = change({"token": 1}), change({"token": 2})
+    orders = FakeOrders(
+        [
+            FakeStream([first], AutoReconnect("primary stepped down")),
+            FakeStream([second], None),
+        ]
+    )
+
+    broadcast = tail(orders, monkeypatch, calls=2)
+
+    assert orders.resumed_after == [None, {"token": 1}]
+    assert broadcast == [first["fullDocument"]["_id"], second["fullDocument"]["_id"]]
+
+
+def test_lost_resume_token_starts_over(monkeypatch):
+    lost = OperationFailure("history lost", code=286)
+    orders = FakeOrders(
+        [
+            FakeStream([change({"token": 1})], AutoReconnect("network")),
+            FakeStream([], lost),
+            FakeStream([], None),
+        ]
+    )
+
+    tail(orders, monkeypatch, calls=3)
+
+    assert orders.resumed_after == [None, {"token": 1}, None]
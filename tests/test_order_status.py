@@ -0,0 +1,97 @@
+import asyncio
+from datetime import datetime
+
+from bson import ObjectId
+
+from app.orders import services
+from app.orders.schemas import OrderStatusUpdate
+from app.orders.services import bulk_transition_orders
+
+
+def insert_order(db, quantity):
+    product = {"_id": ObjectId(), "stock_quantity": 0, "seller_id": str(ObjectId())}
+    order = {
+        "_id": ObjectId(),
+        "buyer_id": ObjectId(),
+        "status": "pending",
+        "updated_at": datetime(2024, 1, 1),
+        "created_at": datetime(2024, 1, 1),
+        "items": [
+            {
+                "product_id": str(product["_id"]),
+                "seller_id": product["seller_id"],
+                "product_name": "Rice",
+                "price": 10.0,
+                "quantity": quantity,
+                "subtotal": 10.0 * quantity,
+            }
+        ],
+    }
+
+    async def insert():
+        await db["products"].insert_one(product)
+        await db["orders"].insert_one(order)
+
+    asyncio.run(insert())
+    return order, product
+
+
+def stock_of(db, product):
+    async def read():
+        return (await db["products"].find_one({"_id": product["_id"]}))[
+            "stock_quantity"
+        ]
+
+    return asyncio.run(read())
+
+
+def test_cancel_gives_the_stock_back(db):
+    order, product = insert_order(db, 3)
+    update = OrderStatusUpdate(id=str(order["_id"]), status="cancelled")
+
+    [result] = asyncio.run(bulk_transition_orders(db, [update]))
+
+    assert result["result"] == "updated"
+    assert stock_of(db, product) == 3
+
+
+def test_invalid_transition_is_reported(db):
+    order, _ = insert_order(db, 3)
+    update = OrderStatusUpdate(id=str(order["_id"]), status="completed")
+
+    [result] = asyncio.run(bulk_transition_orders(db, [update]))
+
+    assert result["result"] == "error"
+    assert result["detail"] == "Cannot move order from pending to completed."
+
+
+def test_cancel_skips_orders_edited_after_the_read(db, monkeypatch):
+    order, product = insert_order(db, 3)
+    update = OrderStatusUpdate(id=str(order["_id"]), status="cancelled")
+
+    async def edit_then_write(callback):
+        # What order_update_job does between our read and our write.
+        await db["orders"].update_one(
+            {"_id": order["_id"]},
+            {
+                "$set": {
+                    "items.0.quantity": 5,
+                    "updated_at": datetime(2024, 1, 2),
+                }
+            },
+        )
+        return await callback(None)
+
+    monkeypatch.setattr(services, "run_in_transaction", edit_then_write)
+    [result] = asyncio.run(bulk_transition_orders(db, [update]))
+
+    assert result["result"] == "error"
+    assert result["detail"] == "Order was changed by another request."
+    assert stock_of(db, product) == 0
+
+    async def read():
+        return await db["orders"].find_one({"_id": order["_id"]})
+
+    stored = asyncio.run(read())
+    assert stored["status"] == "pending"
+    assert "status_batch" not in stored
@@ -0,0 +1,98 @@
+import asyncio
+import base64
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+from fastapi import HTTPException
+
+from app.core import pagination, settings
+from app.core.pagination import (
+    decode_cursor,
+    encode_cursor,
+    paginate_aggregate,
+    paginate_cursor,
+)
+
+
+def test_cursor_round_trip():
+    values = [datetime(2024, 1, 2, 3, 4, 5), ObjectId()]
+    cursor = encode_cursor("created_at", values)
+
+    assert decode_cursor("created_at", cursor) == values
+
+
+def test_tampered_cursor_is_rejected():
+    cursor = encode_cursor("_id", [ObjectId()])
+    raw = bytearray(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    raw[-3] ^= 1
+    tampered = base64.urlsafe_b64encode(bytes(raw)).decode().rstrip("=")
+
+    with pytest.raises(HTTPException) as e:
+        decode_cursor("_id", tampered)
+    assert e.value.status_code == 400
+
+
+@pytest.mark.parametrize("cursor", ["", "not-a-cursor", "!!!"])
+def test_garbage_cursor_is_rejected(cursor):
+    with pytest.raises(HTTPException) as e:
+        decode_cursor("_id", cursor)
+    assert e.value.status_code == 400
+
+
+def test_cursor_for_another_sort_key_is_rejected():
+    cursor = encode_cursor("_id", [ObjectId()])
+
+    with pytest.raises(HTTPException) as e:
+        decode_cursor("created_at", cursor)
+    assert e.value.status_code == 400
+
+
+def test_paginate_cursor_walks_every_document_once(db):
+    start = datetime(2024, 1, 1)
+    # Pairs of documents share a created_at so the _id tie breaker is used.
+    documents = [
+        {"_id": ObjectId(), "created_at": start + timedelta(days=i // 2)}
+        for i in range(7)
+    ]
+
+    async def run():
+        await db["orders"].insert_many(documents)
+        seen, cursor = [], ""
+        while cursor is not None:
+            page = await paginate_cursor(
+                db["orders"],
+                {},
+                cursor=cursor,
+                page_size=3,
+                sort_key="created_at",
+                direction=-1,
+            )
+            seen.extend(document["_id"] for document in page["items"])
+            cursor = page["meta"]["next_cursor"]
+        return seen
+
+    seen = asyncio.run(run())
+    expected = sorted(
+        documents, key=lambda d: (d["created_at"], d["_id"]), reverse=True
+    )
+    assert seen == [document["_id"] for document in expected]
+
+
+def test_paginate_aggregate_caps_the_total(db, monkeypatch):
+    monkeypatch.setattr(settings, "PAGE_COUNT_LIMIT", 3)
+    pagination.page_totals.clear()
+    asyncio.run(db["items"].insert_many([{"n": n} for n in range(5)]))
+
+    page = asyncio.run(
+        paginate_aggregate(
+            db["items"],
+            [{"$match": {"n": {"$gte": 1}}}, {"$sort": {"n": 1}}],
+            page=2,
+            page_size=2,
+        )
+    )
+
+    assert [item["n"] for item in page["items"]] == [3, 4]
+    assert page["meta"]["total_items"] == 3
+    assert page["meta"]["total_capped"] is True
@@ -0,0 +1,100 @@
+import asyncio
+from collections import Counter
+
+from bson import ObjectId
+
+from app.orders.inventory import reserve_stock
+from app.products import services
+from app.products.schemas import ProductCreateSchema
+from app.products.services import PRODUCT_CHANGED, bulk_write_products, product_update
+
+SELLER_ID = str(ObjectId())
+
+
+def make_row(stock):
+    return ProductCreateSchema(
+        name="Rice",
+        description="50kg bag",
+        category="grains",
+        unit="bag",
+        price_per_unit=100.0,
+        stock_quantity=stock,
+        seller_id=SELLER_ID,
+    )
+
+
+def insert_product(db, stock):
+    product = {
+        **make_row(stock).dict(),
+        "_id": ObjectId(),
+        "version": 1,
+    }
+    asyncio.run(db["products"].insert_one(product))
+    return product
+
+
+def read(db, product):
+    return asyncio.run(db["products"].find_one({"_id": product["_id"]}))
+
+
+def test_update_keeps_reservations_taken_since_the_read(db):
+    product = insert_product(db, 10)
+    asyncio.run(reserve_stock(db, ObjectId(), Counter({str(product["_id"]): 3})))
+
+    query, update = product_update(product, make_row(15).dict())
+    result = asyncio.run(db["products"].update_one(query, update))
+
+    assert result.matched_count == 1
+    stored = read(db, product)
+    assert stored["stock_quantity"] == 12
+    assert stored["version"] == 2
+
+
+def test_update_does_not_take_reserved_stock_below_zero(db):
+    product = insert_product(db, 10)
+    asyncio.run(reserve_stock(db, ObjectId(), Counter({str(product["_id"]): 8})))
+
+    query, update = product_update(product, make_row(5).dict())
+    result = asyncio.run(db["products"].update_one(query, update))
+
+    assert result.matched_count == 0
+    assert read(db, product)["stock_quantity"] == 2
+
+
+def test_bulk_update_applies_stock_as_a_delta(db, monkeypatch):
+    product = insert_product(db, 10)
+    find_existing_products = services.find_existing_products
+
+    async def reserve_after_read(db, keys):
+        existing = await find_existing_products(db, keys)
+        await reserve_stock(db, ObjectId(), Counter({str(product["_id"]): 3}))
+        return existing
+
+    monkeypatch.setattr(services, "find_existing_products", reserve_after_read)
+    [result] = asyncio.run(bulk_write_products(db, [make_row(20)], True))
+
+    assert result["status"] == "updated"
+    stored = read(db, product)
+    assert stored["stock_quantity"] == 17
+    assert "write_batch" not in stored
+
+
+def test_bulk_update_skips_products_edited_since_the_read(db, monkeypatch):
+    product = insert_product(db, 10)
+    find_existing_products = services.find_existing_products
+
+    async def edit_after_read(db, keys):
+        existing = await find_existing_products(db, keys)
+        await db["products"].update_one(
+            {"_id": product["_id"]},
+            {"$set": {"stock_quantity": 4}, "$inc": {"version": 1}},
+        )
+        return existing
+
+    monkeypatch.setattr(services, "find_existing_products", edit_after_read)
+    [result] = asyncio.run(bulk_write_products(db, [make_row(20)], True))
+
+    assert result == {"index": 0, "status": "error", "detail": PRODUCT_CHANGED}
+    stored = read(db, product)
+    assert stored["stock_quantity"] == 4
+    assert "write_batch" not in stored
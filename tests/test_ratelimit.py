@@ -0,0 +1,152 @@
+import asyncio
+
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from app.core.ratelimit import (
+    BucketStore,
+    RateLimiter,
+    RateLimitMiddleware,
+    RouteLimit,
+    parse_rate,
+)
+
+
+def test_parse_rate():
+    assert parse_rate("10/60") == (10, 60.0)
+    assert parse_rate("") is None
+
+
+def test_bucket_refills_over_time():
+    store = BucketStore(10)
+    rate = (2, 10.0)
+    assert store.take("k", rate, 0) == 0
+    assert store.take("k", rate, 0) == 0
+    assert store.take("k", rate, 0) == 5.0
+    # One token comes back every five seconds.
+    assert store.take("k", rate, 5) == 0
+    assert store.take("k", rate, 5) == 5.0
+
+
+def test_bucket_store_evicts_least_recently_used():
+    store = BucketStore(2)
+    rate = (1, 60.0)
+    store.take("a", rate, 0)
+    store.take("b", rate, 0)
+    store.take("a", rate, 1)
+    store.take("c", rate, 1)
+
+    assert len(store) == 2
+    assert store.evictions == 1
+    # "b" was evicted and comes back with a full bucket.
+    assert store.take("b", rate, 1) == 0
+
+
+def test_wait_takes_no_token():
+    store = BucketStore(10)
+    rate = (1, 10.0)
+    assert store.wait("k", rate, 0) == 0
+    assert store.wait("k", rate, 0) == 0
+    assert store.take("k", rate, 0) == 0
+    assert store.wait("k", rate, 0) == 10.0
+
+
+def test_limiter_rejects_by_ip_and_by_account():
+    limiter = RateLimiter(100)
+    limit = RouteLimit(ip=(2, 60.0), account=(1, 60.0))
+
+    assert limiter.check("/login", limit, "1.1.1.1", "a@x.com") is None
+    status, _, retry_after = limiter.check("/login", limit, "1.1.1.1", "a@x.com")
+    assert status == 429 and retry_after > 0
+
+    # The rejected attempt took no token from the IP bucket.
+    assert limiter.check("/login", limit, "1.1.1.1", "b@x.com") is None
+    status, _, _ = limiter.check("/login", limit, "1.1.1.1", "c@x.com")
+    assert status == 429
+
+    counters = limiter.stats()["routes"]["/login"]
+    assert counters["allowed"] == 2
+    assert counters["limited_account"] == 1
+    assert counters["limited_ip"] == 1
+
+
+def make_client(limit, max_body=1024):
+    async def login(request):
+        await request.json()
+        return JSONResponse({"ok": True})
+
+    limiter = RateLimiter(100)
+    limiter.register("POST", "/login", limit)
+    app = Starlette(routes=[Route("/login", login, methods=["POST"])])
+    app.add_middleware(RateLimitMiddleware, limiter=limiter, max_body=max_body)
+    return TestClient(app), limiter
+
+
+def test_middleware_returns_429_with_retry_after():
+    client, _ = make_client(RouteLimit(account=(1, 30.0)))
+
+    response = client.post("/login", json={"email": "A@x.com "})
+    assert response.status_code == 200
+    assert response.json() == {"ok": True}
+
+    response = client.post("/login", json={"email": "a@x.com"})
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "30"
+
+    response = client.post("/login", json={"email": "b@x.com"})
+    assert response.status_code == 200
+
+
+def test_middleware_sheds_over_max_concurrent():
+    client, limiter = make_client(RouteLimit(max_concurrent=1))
+
+    limiter.in_flight["/login"] = 1
+    response = client.post("/login", json={})
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+
+    limiter.in_flight["/login"] = 0
+    assert client.post("/login", json={}).status_code == 200
+    assert limiter.in_flight["/login"] == 0
+
+
+def test_middleware_rejects_large_bodies():
+    client, limiter = make_client(RouteLimit(account=(5, 30.0)), max_body=64)
+
+    response = client.post("/login", json={"email": "a@x.com", "pad": "x" * 100})
+    assert response.status_code == 413
+    assert limiter.stats()["routes"]["/login"]["too_large"] == 1
+
+    assert client.post("/login", json={"email": "a@x.com"}).status_code == 200
+
+
+def test_blocked_ip_is_rejected_before_the_body_is_read():
+    limiter = RateLimiter(100)
+    limit = RouteLimit(ip=(1, 60.0), account=(5, 60.0))
+    limiter.register("POST", "/login", limit)
+    limiter.check("/login", limit, "1.1.1.1", None)
+    reads, sent = [], []
+
+    async def app(scope, receive, send):
+        raise AssertionError("the app must not run")
+
+    async def receive():
+        reads.append(1)
+        return {"type": "http.request", "body": b'{"email": "a@x.com"}'}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {
+        "type": "http",
+        "method": "POST",
+        "path": "/login",
+        "client": ("1.1.1.1", 1234),
+        "headers": [],
+    }
+    asyncio.run(RateLimitMiddleware(app, limiter)(scope, receive, send))
+
+    assert reads == []
+    assert sent[0]["status"] == 429
@@ -0,0 +1,46 @@
+from datetime import datetime
+
+from bson import ObjectId
+from pymongo import UpdateOne
+
+from app.analytics.services import rollup_operations
+
+
+def make_order(status="pending"):
+    return {"_id": ObjectId(), "status": status, "created_at": datetime(2024, 5, 1)}
+
+
+def make_item(product_id):
+    return {
+        "product_id": product_id,
+        "seller_id": "seller",
+        "product_name": "Rice",
+        "quantity": 2,
+        "subtotal": 20.0,
+    }
+
+
+def test_lines_with_malformed_product_ids_are_skipped():
+    product_id = str(ObjectId())
+    items = [make_item(product_id), make_item("not-an-id")]
+
+    operations = rollup_operations(make_order(), items)
+
+    assert operations == [
+        UpdateOne(
+            {
+                "seller_id": "seller",
+                "product_id": product_id,
+                "day": datetime(2024, 5, 1),
+            },
+            {
+                "$inc": {"quantity": 2, "revenue": 20.0, "lines": 1},
+                "$set": {"product_name": "Rice"},
+            },
+            upsert=True,
+        )
+    ]
+
+
+def test_cancelled_orders_are_not_counted():
+    assert rollup_operations(make_order("cancelled"), [make_item("x")]) == []
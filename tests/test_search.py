@@ -0,0 +1,45 @@
+from app.core.search import PrefixIndex
+
+
+def make_index():
+    index = PrefixIndex()
+    index.rebuild(
+        [
+            ("1", "Brown Rice"),
+            ("2", "Basmati rice"),
+            ("3", "Brown bread"),
+            ("4", "Red beans"),
+        ]
+    )
+    return index
+
+
+def test_search_matches_any_word_prefix():
+    index = make_index()
+
+    assert {hit["id"] for hit in index.search("bro")} == {"1", "3"}
+    assert {hit["id"] for hit in index.search("ri")} == {"1", "2"}
+
+
+def test_search_is_case_and_whitespace_insensitive():
+    index = make_index()
+
+    assert index.search("  BROWN   r ") == [{"id": "1", "name": "Brown Rice"}]
+
+
+def test_search_respects_limit_and_ignores_empty_prefix():
+    index = make_index()
+
+    assert len(index.search("b", limit=2)) == 2
+    assert index.search("   ") == []
+
+
+def test_add_replaces_and_remove_drops_entries():
+    index = make_index()
+    index.add("1", "Wild rice")
+    index.remove("4")
+
+    assert index.search("brown r") == []
+    assert index.search("wild") == [{"id": "1", "name": "Wild rice"}]
+    assert index.search("red") == []
+    assert len(index) == 3
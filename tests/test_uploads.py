@@ -0,0 +1,141 @@
+import asyncio
+import io
+import os
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+from starlette.datastructures import UploadFile
+
+from app.uploads import services
+from app.uploads.schemas import ImageJobStatus
+from app.uploads.services import UploadPipeline
+from app.uploads.storage import LocalStorage
+
+
+def make_pipeline(tmp_path, retries=1):
+    storage = LocalStorage(str(tmp_path / "uploads"))
+    return UploadPipeline(storage, workers=1, max_pending=4, retries=retries)
+
+
+def make_file():
+    return UploadFile(io.BytesIO(b"image bytes"), filename="image.png")
+
+
+async def save_result(db, job, uploaded):
+    return {"url": uploaded["url"]}
+
+
+async def run_job(db, pipeline, on_complete=save_result):
+    job = await pipeline.submit(
+        db, make_file(), "product_image", "1", None, on_complete
+    )
+    await pipeline.wait(str(job["_id"]), timeout=5)
+    return await db["image_jobs"].find_one({"_id": job["_id"]})
+
+
+def test_upload_to_local_storage(db, tmp_path):
+    pipeline = make_pipeline(tmp_path)
+    job = asyncio.run(run_job(db, pipeline))
+
+    assert job["status"] == ImageJobStatus.DONE
+    assert job["result"]["url"].endswith(str(job["_id"]))
+    with open(tmp_path / "uploads" / str(job["_id"]), "rb") as uploaded:
+        assert uploaded.read() == b"image bytes"
+    assert pipeline.pending == 0
+    assert pipeline._events == {}
+
+
+def test_failed_completion_marks_job_failed(db, tmp_path):
+    async def fail(db, job, uploaded):
+        raise RuntimeError("boom")
+
+    pipeline = make_pipeline(tmp_path)
+    job = asyncio.run(run_job(db, pipeline, fail))
+
+    assert job["status"] == ImageJobStatus.FAILED
+    assert job["error"] == "boom"
+    assert pipeline.pending == 0
+
+
+def test_zero_retries_still_uploads_once(db, tmp_path):
+    pipeline = make_pipeline(tmp_path, retries=0)
+    job = asyncio.run(run_job(db, pipeline))
+
+    assert job["status"] == ImageJobStatus.DONE
+
+
+def test_waiters_are_released_when_recording_the_job_fails(db, tmp_path, monkeypatch):
+    pipeline = make_pipeline(tmp_path)
+
+    async def run():
+        job = await pipeline.submit(
+            db, make_file(), "product_image", "1", None, save_result
+        )
+
+        async def broken_update(*args, **kwargs):
+            raise RuntimeError("database down")
+
+        monkeypatch.setattr(type(db["image_jobs"]), "update_one", broken_update)
+        await asyncio.wait_for(pipeline.wait(str(job["_id"]), timeout=5), 1)
+        monkeypatch.undo()
+        return await db["image_jobs"].find_one({"_id": job["_id"]})
+
+    job = asyncio.run(run())
+    assert job["status"] == ImageJobStatus.PENDING
+    assert pipeline.pending == 0
+    assert pipeline._events == {}
+
+
+def test_spool_file_is_removed_when_the_job_cannot_be_recorded(
+    db, tmp_path, monkeypatch
+):
+    pipeline = make_pipeline(tmp_path)
+    spool_upload, spooled = services.spool_upload, []
+
+    def spool(file):
+        spooled.append(spool_upload(file))
+        return spooled[-1]
+
+    async def broken_insert(*args, **kwargs):
+        raise RuntimeError("database down")
+
+    monkeypatch.setattr(services, "spool_upload", spool)
+    monkeypatch.setattr(type(db["image_jobs"]), "insert_one", broken_insert)
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(run_job(db, pipeline))
+
+    assert len(spooled) == 1
+    assert not os.path.exists(spooled[0])
+    assert pipeline.pending == 0
+
+
+def test_cleanup_stale_fails_old_pending_jobs(db, tmp_path):
+    pipeline = make_pipeline(tmp_path)
+    old, recent = ObjectId(), ObjectId()
+
+    async def run():
+        await db["image_jobs"].insert_many(
+            [
+                {
+                    "_id": old,
+                    "status": ImageJobStatus.PENDING,
+                    "created_at": datetime.now() - timedelta(days=1),
+                },
+                {
+                    "_id": recent,
+                    "status": ImageJobStatus.PENDING,
+                    "created_at": datetime.now(),
+                },
+            ]
+        )
+        await pipeline.cleanup_stale(db)
+        return (
+            await db["image_jobs"].find_one({"_id": old}),
+            await db["image_jobs"].find_one({"_id": recent}),
+        )
+
+    old_job, recent_job = asyncio.run(run())
+    assert old_job["status"] == ImageJobStatus.FAILED
+    assert recent_job["status"] == ImageJobStatus.PENDING